@@ -106,7 +106,6 @@ main() {
     python3 -m venv venv
     source venv/bin/activate
     pip install -r requirements.txt
-    pip install torch torchvision torchaudio
 
     print_status "Starting backend..."
     python3 src/app.py --embedding-model all-minilm --generation-model qwen2.5 &
@@ -0,0 +1,122 @@
+"""Benchmark the vectorized cluster statistics against the original Python loops.
+
+Usage (from tangent-api/):
+    python benchmarks/bench_cluster_stats.py [--sizes 1000 10000 50000] [--cluster-size 250]
+
+The loop baselines need the dense float64 distance matrix, so they are skipped
+for sizes where that matrix would exceed --max-dense-gb.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from scipy.spatial.distance import pdist, squareform
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from services.cluster_stats import (  # noqa: E402
+    coherence_from_distances,
+    compute_cluster_stats,
+    reassign_outliers,
+)
+
+
+def loop_coherence(clusters, distance_matrix):
+    """Coherence as generate_cluster_metadata computed it before"""
+    coherence = {}
+    for cluster_id in np.unique(clusters):
+        cluster_indices = np.where(clusters == cluster_id)[0]
+        coherence[cluster_id] = 1.0
+        if len(cluster_indices) > 1:
+            cluster_distances = distance_matrix[cluster_indices][:, cluster_indices]
+            coherence[cluster_id] = np.mean(
+                [
+                    1 - cluster_distances[i, j]
+                    for i in range(len(cluster_indices))
+                    for j in range(i + 1, len(cluster_indices))
+                ]
+            )
+    return coherence
+
+
+def loop_outliers(clusters, distance_matrix):
+    """Outlier reassignment as handle_outliers computed it before"""
+    clusters = clusters.copy()
+    outlier_indices = np.where(clusters == -1)[0]
+    valid_clusters = np.unique(clusters[clusters != -1])
+    for idx in outlier_indices:
+        distances_to_clusters = {}
+        for valid_cluster in valid_clusters:
+            cluster_points = clusters == valid_cluster
+            distances_to_clusters[valid_cluster] = np.mean(distance_matrix[idx, cluster_points])
+        clusters[idx] = min(distances_to_clusters.items(), key=lambda x: x[1])[0]
+    return clusters
+
+
+def make_data(n_points, dim=384, cluster_size=50, outlier_share=0.05, seed=0):
+    rng = np.random.default_rng(seed)
+    n_clusters = max(2, n_points // cluster_size)
+    centers = rng.normal(size=(n_clusters, dim))
+    clusters = rng.integers(0, n_clusters, n_points)
+    embeddings = centers[clusters] + 0.5 * rng.normal(size=(n_points, dim))
+    clusters[rng.random(n_points) < outlier_share] = -1
+    return embeddings.astype(np.float32), clusters
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--cluster-size", type=int, default=250)
+    parser.add_argument("--max-dense-gb", type=float, default=2.0)
+    args = parser.parse_args()
+
+    print(f"{'points':>8} {'stage':<22} {'loops (s)':>10} {'vectorized (s)':>15} {'speedup':>8}")
+    for n_points in args.sizes:
+        embeddings, clusters = make_data(n_points, cluster_size=args.cluster_size)
+
+        dense_gb = n_points * n_points * 8 / 1e9
+        if dense_gb > args.max_dense_gb:
+            _, stats_seconds = timed(compute_cluster_stats, embeddings, clusters)
+            print(f"{n_points:>8} {'all cluster stats':<22} {'-':>10} {stats_seconds:>15.3f} {'-':>8}")
+            print(f"{n_points:>8} {'loop baselines':<22} skipped, matrix would need {dense_gb:.1f} GB")
+            continue
+
+        distance_matrix = squareform(pdist(embeddings, metric="cosine"))
+
+        loop_result, loop_seconds = timed(loop_outliers, clusters, distance_matrix)
+        fast_result, fast_seconds = timed(reassign_outliers, clusters, distance_matrix)
+        assert np.array_equal(loop_result, fast_result)
+        print(
+            f"{n_points:>8} {'outlier reassignment':<22} {loop_seconds:>10.3f} "
+            f"{fast_seconds:>15.3f} {loop_seconds / fast_seconds:>7.1f}x"
+        )
+
+        assigned = fast_result
+        loop_result, loop_seconds = timed(loop_coherence, assigned, distance_matrix)
+        fast_result, fast_seconds = timed(coherence_from_distances, assigned, distance_matrix)
+        assert all(abs(loop_result[k] - fast_result[k]) < 1e-6 for k in loop_result)
+        print(
+            f"{n_points:>8} {'coherence (matrix)':<22} {loop_seconds:>10.3f} "
+            f"{fast_seconds:>15.3f} {loop_seconds / fast_seconds:>7.1f}x"
+        )
+
+        # What the pipeline runs: coherence plus silhouette, spreads and
+        # nearest clusters, computed from embeddings
+        stats, stats_seconds = timed(compute_cluster_stats, embeddings, assigned)
+        assert all(abs(loop_result[k] - stats[k]["coherence"]) < 1e-4 for k in loop_result)
+        print(
+            f"{n_points:>8} {'all cluster stats':<22} {loop_seconds:>10.3f} "
+            f"{stats_seconds:>15.3f} {loop_seconds / stats_seconds:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
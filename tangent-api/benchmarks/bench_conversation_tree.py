@@ -0,0 +1,87 @@
+"""Benchmark branch assignment against the original per-node child scan.
+
+Usage (from tangent-api/):
+    python benchmarks/bench_conversation_tree.py [--sizes 1000 5000 20000]
+
+Each chat is a long main thread with a share of edited (branching) messages.
+The quadratic baseline is skipped above --max-baseline nodes.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from services.conversation_tree import assign_branches  # noqa: E402
+
+
+def scan_branches(messages):
+    """Branch assignment as process_claude_messages did it before"""
+    assigned = {}
+    roots = [msg for msg in messages if not msg["parent_message_id"]]
+    for root in roots:
+        branch_queue = [(root, "0")]
+        while branch_queue:
+            current_msg, current_branch = branch_queue.pop(0)
+            assigned[current_msg["message_id"]] = current_branch
+            children = [
+                msg
+                for msg in messages
+                if msg["parent_message_id"] == current_msg["message_id"]
+            ]
+            if len(children) > 1:
+                for idx, child in enumerate(children):
+                    branch_queue.append((child, f"{current_branch}.{idx}"))
+            elif children:
+                branch_queue.append((children[0], current_branch))
+    return assigned
+
+
+def make_chat(n_nodes, branch_share=0.05, seed=0):
+    rng = random.Random(seed)
+    messages = [{"message_id": "m0", "parent_message_id": None}]
+    tip = "m0"
+    for i in range(1, n_nodes):
+        # Mostly extend the current thread; sometimes re-answer an earlier message
+        parent = messages[rng.randrange(len(messages))]["message_id"] if rng.random() < branch_share else tip
+        messages.append({"message_id": f"m{i}", "parent_message_id": parent})
+        tip = f"m{i}"
+    return messages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000, 20000])
+    parser.add_argument("--max-baseline", type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"{'nodes':>8} {'scan (s)':>10} {'indexed (s)':>12} {'speedup':>8}")
+    for n_nodes in args.sizes:
+        messages = make_chat(n_nodes)
+
+        start = time.perf_counter()
+        branches, _, _ = assign_branches(
+            [msg["message_id"] for msg in messages],
+            [msg["parent_message_id"] for msg in messages],
+        )
+        indexed_seconds = time.perf_counter() - start
+
+        if n_nodes > args.max_baseline:
+            print(f"{n_nodes:>8} {'skipped':>10} {indexed_seconds:>12.4f} {'-':>8}")
+            continue
+
+        start = time.perf_counter()
+        expected = scan_branches(messages)
+        scan_seconds = time.perf_counter() - start
+
+        assert expected == {msg["message_id"]: b for msg, b in zip(messages, branches)}
+        print(
+            f"{n_nodes:>8} {scan_seconds:>10.3f} {indexed_seconds:>12.4f} "
+            f"{scan_seconds / indexed_seconds:>7.0f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
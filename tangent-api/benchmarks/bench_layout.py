@@ -0,0 +1,70 @@
+"""Benchmark warm-started monthly UMAP layouts against cold fits.
+
+Usage (from tangent-api/):
+    python benchmarks/bench_layout.py [--months 6] [--start 1000] [--growth 200]
+
+Both modes run on the same synthetic months, each adding --growth new points
+to the previous month's. A throwaway fit first compiles UMAP's numba kernels,
+so neither mode pays JIT time. Per month the table shows fit seconds and how
+far carried-over points moved from the previous month's layout (after the
+Procrustes alignment both modes apply), in units of the layout's spread.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from services.layout import LayoutReducer  # noqa: E402
+
+
+def make_months(n_months, start, growth, dim=384, n_topics=40, seed=0):
+    rng = np.random.default_rng(seed)
+    n_points = start + growth * (n_months - 1)
+    centers = rng.normal(size=(n_topics, dim))
+    topics = rng.integers(0, n_topics, n_points)
+    embeddings = (centers[topics] + 0.6 * rng.normal(size=(n_points, dim))).astype(np.float32)
+    titles = [f"chat {i} (Branch 0)" for i in range(n_points)]
+    return [(titles[: start + growth * m], embeddings[: start + growth * m]) for m in range(n_months)]
+
+
+def run(mode, months):
+    reducer = LayoutReducer(mode=mode)
+    rows = []
+    for titles, embeddings in months:
+        start = time.perf_counter()
+        layout, stats = reducer.fit_transform(titles, embeddings)
+        seconds = time.perf_counter() - start
+        spread = float(np.linalg.norm(layout - layout.mean(axis=0), axis=1).mean())
+        displacement = stats.get("mean_displacement")
+        rows.append((len(titles), seconds, displacement / spread if displacement is not None else None))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--months", type=int, default=6)
+    parser.add_argument("--start", type=int, default=1000)
+    parser.add_argument("--growth", type=int, default=200)
+    args = parser.parse_args()
+
+    months = make_months(args.months, args.start, args.growth)
+    # Compile numba kernels once, outside of any timed fit
+    LayoutReducer(mode="cold").fit_transform(*months[0])
+
+    cold = run("cold", months)
+    warm = run("warm", months)
+
+    print(f"{'points':>7} {'cold (s)':>9} {'warm (s)':>9} {'speedup':>8} {'cold moved':>11} {'warm moved':>11}")
+    for (n_points, cold_s, cold_d), (_, warm_s, warm_d) in zip(cold, warm):
+        moved = (
+            f"{cold_d:>11.3f} {warm_d:>11.3f}" if cold_d is not None else f"{'-':>11} {'-':>11}"
+        )
+        print(f"{n_points:>7} {cold_s:>9.2f} {warm_s:>9.2f} {cold_s / warm_s:>7.1f}x {moved}")
+
+
+if __name__ == "__main__":
+    main()
@@ -18,3 +18,67 @@ REQUIRED_FILES = [
     "chat_titles.json",
     "reflections.json",
 ]
+
+# Embedding cache
+CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(BASE_DATA_DIR, "cache"))
+EMBEDDING_CACHE_DIR = os.path.join(CACHE_DIR, "embeddings")
+EMBEDDING_CACHE_MEMORY_SIZE = int(os.getenv("EMBEDDING_CACHE_MEMORY_SIZE", "50000"))
+
+# Ollama client
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
+OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", "120"))
+OLLAMA_MAX_RETRIES = int(os.getenv("OLLAMA_MAX_RETRIES", "3"))
+OLLAMA_RETRY_BACKOFF = float(os.getenv("OLLAMA_RETRY_BACKOFF", "1.0"))
+OLLAMA_POOL_SIZE = int(os.getenv("OLLAMA_POOL_SIZE", "8"))
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "256"))
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))
+
+# Topic labelling: at most TOPIC_CONCURRENCY LLM calls at once, each a single
+# attempt of at most TOPIC_TIMEOUT seconds before falling back to "Miscellaneous"
+TOPIC_CONCURRENCY = int(os.getenv("TOPIC_CONCURRENCY", "2"))
+TOPIC_TIMEOUT = float(os.getenv("TOPIC_TIMEOUT", "60"))
+
+# Encoded /visualization and /state responses kept in memory, least recently
+# used evicted first once either limit is exceeded
+PAYLOAD_CACHE_MAX_ENTRIES = int(os.getenv("PAYLOAD_CACHE_MAX_ENTRIES", "256"))
+PAYLOAD_CACHE_MAX_BYTES = int(os.getenv("PAYLOAD_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# LLM response cache
+LLM_CACHE_PATH = os.path.join(CACHE_DIR, "llm_responses.jsonl")
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+
+# Monthly pipeline: "incremental" carries titles and embeddings forward between
+# months, "full" recomputes everything from the cumulative data each month,
+# "parallel" fits the incremental months independently in PIPELINE_WORKERS
+# processes (cold layouts, aligned to the previous month afterwards). Every
+# worker pays its own import and JIT start-up, and all of them share the
+# TOPIC_CONCURRENCY limit, so a few workers are usually enough
+PIPELINE_MODE = os.getenv("PIPELINE_MODE", "incremental")
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", str(min(2, os.cpu_count() or 1))))
+
+# 2D layout: "warm" seeds each month's UMAP from the previous month's layout,
+# "cold" fits every month from scratch
+UMAP_MODE = os.getenv("UMAP_MODE", "warm")
+UMAP_WARM_MIN_EPOCHS = int(os.getenv("UMAP_WARM_MIN_EPOCHS", "50"))
+UMAP_INIT_NEIGHBORS = int(os.getenv("UMAP_INIT_NEIGHBORS", "5"))
+
+# Clustering: exports with at least this many branches use the sparse kNN-graph
+# backend instead of a dense n x n distance matrix
+SPARSE_CLUSTERING_MIN_POINTS = int(os.getenv("SPARSE_CLUSTERING_MIN_POINTS", "5000"))
+KNN_NEIGHBORS = int(os.getenv("KNN_NEIGHBORS", "15"))
+KNN_BLOCK_SIZE = int(os.getenv("KNN_BLOCK_SIZE", "2048"))
+
+# Monthly states: a full snapshot every STATE_KEYFRAME_INTERVAL months, deltas
+# against the previous month in between. Point moves up to the tolerance are
+# not stored (0 keeps the states exact)
+STATE_KEYFRAME_INTERVAL = int(os.getenv("STATE_KEYFRAME_INTERVAL", "12"))
+STATE_DELTA_TOLERANCE = float(os.getenv("STATE_DELTA_TOLERANCE", "0"))
+
+# Upload processing: tasks run on PROCESSING_WORKERS threads, one at a time per
+# chat type. Uploads are staged under UPLOAD_STAGING_DIR by content hash
+PROCESSING_WORKERS = int(os.getenv("PROCESSING_WORKERS", "2"))
+UPLOAD_STAGING_DIR = os.getenv("UPLOAD_STAGING_DIR", "./unprocessed")
+
+# Task registry: status of every processing task and the months it completed,
+# so unfinished runs resume after a restart
+TASK_REGISTRY_PATH = os.getenv("TASK_REGISTRY_PATH", os.path.join(BASE_DATA_DIR, "tasks.sqlite3"))
@@ -9,4 +9,9 @@ class ProcessingTask:
     chat_type: str = ""
     data_dir: str = ""
     error: Optional[str] = None
-    completed: bool = False
\ No newline at end of file
+    completed: bool = False
+    task_id: str = ""
+    queued_at: float = 0.0
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    cancel_requested: bool = False
\ No newline at end of file
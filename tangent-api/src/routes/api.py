@@ -1,23 +1,69 @@
 from datetime import datetime
 import json
 import os
-from pathlib import Path
+import queue
 import re
+import time
 import traceback
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, send_file
 import numpy as np
-import pandas as pd
-from torch import cosine_similarity
 from services.embedding import get_embeddings
-from services.background_processor import BackgroundProcessor
-from services.data_processing import analyze_branches
-from utils import load_visualization_data
+from services.embedding_cache import get_cache_stats
+from services.llm_cache import get_llm_cache
+from services.background_processor import (
+    get_background_processor,
+    stage_upload,
+    task_final_event,
+)
+from services.branch_analysis import (
+    branch_report_path,
+    build_branch_report,
+    save_branch_report,
+)
+from services.message_index import get_message_index
+from services.reflection_index import get_reflection_index
+from services.topic_messages import get_topic_message_index
+from services.binary_payload import BINARY_MIMETYPE
+from services.metrics import render_metrics
+from services.progress import TERMINAL_EVENTS
+from services.state_store import StateStore
+from services.visualization_cache import (
+    JSON_MIMETYPE,
+    get_state_payload,
+    get_visualization_payload,
+)
 from config import CLAUDE_DATA_DIR, CHATGPT_DATA_DIR, BASE_DATA_DIR
 from services.topic_generation import generate_topic_for_cluster
 from shared_data import models_data
+from utils import send_complete, send_error, send_progress
 
 api_bp = Blueprint("api", __name__)
-background_processor = BackgroundProcessor()
+background_processor = get_background_processor()
+
+
+def negotiated_mimetype():
+    """JSON unless the client explicitly prefers the binary points format"""
+    return request.accept_mimetypes.best_match(
+        [JSON_MIMETYPE, BINARY_MIMETYPE], default=JSON_MIMETYPE
+    )
+
+
+def encoded_payload_response(payload):
+    """Serve a pre-encoded payload, answering 304 when the client's ETag matches"""
+    if request.if_none_match.contains_weak(payload.etag):
+        response = Response(status=304)
+    else:
+        encoding = payload.encoding_for(request.accept_encodings)
+        body = payload.encoded[encoding] if encoding else payload.body
+        response = Response(body, mimetype=payload.mimetype)
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+
+    # The ETag identifies the uncompressed body, so it is weak across encodings
+    response.set_etag(payload.etag, weak=True)
+    response.headers["Vary"] = "Accept, Accept-Encoding"
+    response.headers["Cache-Control"] = "no-cache"
+    return response
 
 
 @api_bp.route("/process", methods=["POST"])
@@ -30,14 +76,12 @@ def process_data():
         if not file.filename.endswith(".json"):
             return jsonify({"error": "Invalid file type"}), 400
 
-        # Save uploaded file
-        data_dir = Path("./unprocessed")
-        data_dir.mkdir(exist_ok=True)
-        file_path = data_dir / "chat_data.json"
-        file.save(file_path)
+        # Stage the upload under its content hash so concurrent uploads
+        # never overwrite each other's file
+        file_path = stage_upload(file.stream)
 
-        # Start background processing
-        task_id = background_processor.start_task(str(file_path))
+        # Queue background processing
+        task_id = background_processor.start_task(file_path)
 
         return jsonify({"task_id": task_id, "message": "Processing started"}), 202
 
@@ -55,11 +99,81 @@ def check_task_status(task_id):
                 "progress": status.progress,
                 "error": status.error,
                 "completed": status.completed,
+                "queue_position": background_processor.queue_position(task_id),
+                "wait_seconds": round(
+                    (status.started_at or time.time()) - status.queued_at, 3
+                ),
             }
         ), 200
     return jsonify({"error": "Task not found"}), 404
 
 
+def progress_event_message(event):
+    """Format a progress bus event with the SSE helpers"""
+    if event["type"] == "complete":
+        return send_complete()
+    if event["type"] == "error":
+        return send_error(event["message"])
+    details = {k: v for k, v in event.items() if k not in ("type", "step", "progress")}
+    return send_progress(event["step"], event["progress"], **details)
+
+
+@api_bp.route("/process/stream/<task_id>", methods=["GET"])
+def stream_task_progress(task_id):
+    """Server-sent progress events of a task until it completes or fails"""
+    task = background_processor.get_task_status(task_id)
+    if task is None:
+        return jsonify({"error": "Task not found"}), 404
+
+    events = background_processor.progress_bus.subscribe(task_id)
+
+    def generate():
+        try:
+            # Tasks that finished before a restart have no events on the bus
+            final_event = task_final_event(task)
+            if final_event is not None and events.empty():
+                yield progress_event_message(final_event)
+                return
+
+            while True:
+                try:
+                    event = events.get(timeout=15)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield progress_event_message(event)
+                if event["type"] in TERMINAL_EVENTS:
+                    return
+        finally:
+            background_processor.progress_bus.unsubscribe(task_id, events)
+
+    return Response(
+        generate(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@api_bp.route("/process/<task_id>", methods=["DELETE"])
+def cancel_task(task_id):
+    if background_processor.get_task_status(task_id) is None:
+        return jsonify({"error": "Task not found"}), 404
+    if not background_processor.cancel_task(task_id):
+        return jsonify({"error": "Task already finished"}), 409
+    return jsonify({"task_id": task_id, "message": "Cancellation requested"}), 202
+
+
+@api_bp.route("/metrics", methods=["GET"])
+def metrics():
+    """Stage timings, item and error counts in the Prometheus text format"""
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+
+@api_bp.route("/process/queue", methods=["GET"])
+def processing_queue():
+    return jsonify(background_processor.queue_stats()), 200
+
+
 @api_bp.route("/get-reflections", methods=["POST"])
 def get_reflections():
     try:
@@ -72,30 +186,18 @@ def get_reflections():
         if not current_context:
             return jsonify({"reflections": []})
 
-        # Generate embedding for current context
-
-        context_embedding = np.array(get_embeddings([current_context])[0]).flatten()
-
-        # Load reflections and embeddings
-        reflections_file = os.path.join(data_dir, "reflections.json")
-        if not os.path.exists(reflections_file):
+        # Reflections and their normalised embeddings, cached in memory
+        reflection_index = get_reflection_index(data_dir)
+        if not reflection_index:
             return jsonify({"reflections": []})
 
-        with open(reflections_file, "r") as f:
-            reflections_data = json.load(f)
-
-        # Compute similarity scores
-        similarities = []
-        for cluster_id, data in reflections_data.items():
-            reflection_embedding = data["embedding"]
-            similarity = np.dot(context_embedding, reflection_embedding) / (
-                np.linalg.norm(context_embedding) * np.linalg.norm(reflection_embedding)
-            )
-            similarities.append((similarity, data["reflection"]))
+        # Generate embedding for current context
+        context_embedding = np.array(get_embeddings([current_context])[0]).flatten()
 
-        # Sort and filter reflections
-        similarities.sort(reverse=True)
-        top_reflections = [ref for sim, ref in similarities[:3] if sim > 0.5]
+        # Top 3 reflections by cosine similarity
+        top_reflections = [
+            ref for sim, ref in reflection_index.top_k(context_embedding, k=3, min_similarity=0.5)
+        ]
 
         return jsonify({"reflections": top_reflections})
 
@@ -133,24 +235,32 @@ def embeddings():
     return jsonify({"embeddings": embeddings}), 200
 
 
+@api_bp.route("/embeddings/cache", methods=["GET"])
+def embedding_cache_stats():
+    return jsonify({"caches": get_cache_stats()}), 200
+
+
+@api_bp.route("/llm-cache", methods=["GET"])
+def llm_cache_stats():
+    return jsonify(get_llm_cache().stats()), 200
+
+
+@api_bp.route("/llm-cache", methods=["DELETE"])
+def invalidate_llm_cache():
+    kind = request.args.get("kind")  # "topic", "reflection" or all when omitted
+    removed = get_llm_cache().invalidate(kind)
+    return jsonify({"removed": removed}), 200
+
+
 @api_bp.route("/visualization", methods=["GET"])
 def get_visualization_data():
     chat_type = request.args.get("type", "claude")  # Default to claude if not specified
     data_dir = CLAUDE_DATA_DIR if chat_type == "claude" else CHATGPT_DATA_DIR
 
     try:
-        data = load_visualization_data(data_dir)
-        if not data["points"] or not data["clusters"] or not data["titles"]:
-            return jsonify([]), 200
-
-        return jsonify(
-            {
-                "points": data["points"],
-                "clusters": data["clusters"],
-                "titles": data["titles"],
-                "topics": data["topics"],
-                "chats_with_reflections": data["chats_with_reflections"],
-            }
+        # Serialised and compressed once per data version and format
+        return encoded_payload_response(
+            get_visualization_payload(data_dir, negotiated_mimetype())
         )
 
     except Exception as e:
@@ -166,37 +276,19 @@ def identify_relevant_messages():
 
         topic_id = request.json["topicId"]
 
-        # Load necessary data
-        with open(os.path.join(data_dir, "messages.json"), "r") as f:
-            all_messages = json.load(f)
-
-        with open(os.path.join(data_dir, "chat_titles.json"), "r") as f:
-            chat_titles = json.load(f)
-
-        with open(os.path.join(data_dir, "clusters.json"), "r") as f:
-            clusters = json.load(f)
-
-        # Get messages from the selected topic
-        topic_messages = []
-        for message in all_messages:
-            chat_index = chat_titles.index(message["chat_name"])
-            if clusters[chat_index] == int(topic_id):
-                topic_messages.append(message)
+        # Message embeddings and their clusters are computed at processing time
+        topic_index = get_topic_message_index(data_dir)
+        message_index = get_message_index(data_dir)
+        if not topic_index or not message_index:
+            return jsonify({"error": "No message embeddings found"}), 404
 
-        # Process messages
-        message_texts = [msg["text"] for msg in topic_messages]
-        embeddings = get_embeddings(message_texts)
-
-        # Calculate scores
-        centroid = np.mean(embeddings, axis=0)
-        similarities = cosine_similarity([centroid], embeddings)[0]
-        lengths = np.array([len(msg["text"]) for msg in topic_messages])
-        length_scores = lengths / np.max(lengths) if lengths.size > 0 else np.array([])
-        final_scores = 0.6 * similarities + 0.4 * length_scores
+        # Index rows follow the message store, stamped ("store", version, mtime)
+        if message_index.stamp[:2] != ("store", topic_index.store_version):
+            return jsonify({"error": "Message embeddings are out of date"}), 409
 
         # Get top messages
-        top_indices = np.argsort(final_scores)[-20:][::-1]
-        top_messages = [topic_messages[i] for i in top_indices]
+        top_rows = topic_index.rank(int(topic_id), limit=20)
+        top_messages = [message_index.messages[i] for i in top_rows]
 
         return jsonify(top_messages)
 
@@ -290,22 +382,13 @@ def get_chat_messages(chat_name):
     try:
         chat_type = request.args.get("type", "chatgpt")
         data_dir = CLAUDE_DATA_DIR if chat_type == "claude" else CHATGPT_DATA_DIR
-        states_dir = os.path.join(data_dir, "states")
 
-        # Get the latest messages file
-        message_files = [f for f in os.listdir(states_dir) if f.startswith("messages_")]
-        if not message_files:
+        message_index = get_message_index(data_dir)
+        if not message_index:
             return jsonify({"error": "No message data found"}), 404
 
-        latest_file = sorted(message_files)[-1]
-        messages_path = os.path.join(states_dir, latest_file)
-
-        print(f"Loading messages from: {messages_path}")
-        with open(messages_path, "r") as f:
-            all_messages = json.load(f)
-
         # Parse chat_name to extract base name and branch_id
-        match = re.match(r"^(.*) \(Branch (\d+)\)$", chat_name)
+        match = re.match(r"^(.*) \(Branch ([\d.]+)\)$", chat_name)
         if match:
             base_chat_name = match.group(1)
             branch_id = match.group(2)
@@ -313,20 +396,12 @@ def get_chat_messages(chat_name):
             base_chat_name = chat_name
             branch_id = "0"  # Default branch ID if none is specified
 
-        # Filter messages based on base_chat_name and branch_id
-        chat_messages = [
-            msg
-            for msg in all_messages
-            if msg.get("chat_name") == base_chat_name
-            and msg.get("branch_id", "0") == branch_id
-        ]
+        # Messages are indexed by chat and branch, already sorted by timestamp
+        chat_messages = message_index.branch(base_chat_name, branch_id)
 
         if not chat_messages:
             return jsonify({"error": f"No messages found for chat: {chat_name}"}), 404
 
-        # Sort messages by timestamp
-        chat_messages.sort(key=lambda x: pd.to_datetime(x.get("timestamp", "0")))
-
         return jsonify({"messages": chat_messages})
 
     except Exception as e:
@@ -340,47 +415,25 @@ def get_all_chat_messages(chat_name):
     try:
         chat_type = request.args.get("type", "chatgpt")
         data_dir = CLAUDE_DATA_DIR if chat_type == "claude" else CHATGPT_DATA_DIR
-        states_dir = os.path.join(data_dir, "states")
 
-        # Get latest messages file
-        message_files = [f for f in os.listdir(states_dir) if f.startswith("messages_")]
-        if not message_files:
+        # Get latest messages
+        message_index = get_message_index(data_dir)
+        if not message_index:
             return jsonify({"error": "No message data found"}), 404
 
-        latest_file = sorted(message_files)[-1]
-        messages_path = os.path.join(states_dir, latest_file)
-
-        print(f"Loading messages from: {messages_path}")
-        with open(messages_path, "r") as f:
-            all_messages = json.load(f)
-
         # **Parse chat_name to extract base name**
-        match = re.match(r"^(.*) \(Branch \d+\)$", chat_name)
+        match = re.match(r"^(.*) \(Branch [\d.]+\)$", chat_name)
         if match:
             base_chat_name = match.group(1)
         else:
             base_chat_name = chat_name
 
-        # **Filter messages for the base chat name**
-        chat_messages = [
-            msg for msg in all_messages if msg.get("chat_name") == base_chat_name
-        ]
+        # Messages grouped by branch_id, each branch sorted by timestamp
+        branches = message_index.branches(base_chat_name)
 
-        if not chat_messages:
+        if not branches:
             return jsonify({"error": f"No messages found for chat: {chat_name}"}), 404
 
-        # Group messages by branch_id
-        from collections import defaultdict
-
-        branches = defaultdict(list)
-        for msg in chat_messages:
-            branch_id = msg.get("branch_id", "0")
-            branches[branch_id].append(msg)
-
-        # Sort messages within each branch
-        for branch_msgs in branches.values():
-            branch_msgs.sort(key=lambda x: pd.to_datetime(x.get("timestamp", "0")))
-
         return jsonify({"branches": branches})
 
     except Exception as e:
@@ -392,124 +445,22 @@ def get_all_chat_messages(chat_name):
 @api_bp.route("/messages/branched", methods=["GET"])
 def get_branched_messages():
     try:
-        print("\n=== Starting Enhanced Branch Analysis ===")
-
         chat_type = request.args.get("type", "chatgpt")
         data_dir = CLAUDE_DATA_DIR if chat_type == "claude" else CHATGPT_DATA_DIR
-        states_dir = os.path.join(data_dir, "states")
-
-        # Load latest messages
-        message_files = [f for f in os.listdir(states_dir) if f.startswith("messages_")]
-        if not message_files:
-            return jsonify({"error": "No message data found"}), 404
-
-        latest_file = sorted(message_files)[-1]
-        messages_path = os.path.join(states_dir, latest_file)
-
-        print(f"\nLoading messages from: {messages_path}")
-        with open(messages_path, "r") as f:
-            all_messages = json.load(f)
-
-        print(f"\nAnalyzing {len(all_messages)} messages for branches")
-
-        # Perform enhanced branch analysis
-        branched_data = analyze_branches(all_messages)
-
-        # Transform the analysis into the API response format
-        response_data = {
-            "branched_chats": {},
-            "stats": {
-                "total_chats_analyzed": len(branched_data),
-                "total_branched_chats": 0,
-                "total_messages_processed": len(all_messages),
-                "branching_structure": {},
-                "edit_branches": {},
-            },
-        }
 
-        # Process each chat's branch data
-        for chat_name, chat_data in branched_data.items():
-            edit_branches = chat_data.get("edit_branches", [])
-            if edit_branches:
-                chat_branches = {"main_branch": [], "branches": {}, "edit_points": []}
-
-                # Process each edit branch
-                for idx, branch in enumerate(edit_branches):
-                    branch_id = f"branch_{idx + 1}"
-
-                    # Find the parent message in the main conversation
-                    parent_message = next(
-                        (
-                            msg
-                            for msg in chat_data["messages"]
-                            if msg.get("message_id") == branch["parent_message"]
-                        ),
-                        None,
-                    )
-
-                    if parent_message:
-                        # Add parent to main branch if not already there
-                        if parent_message not in chat_branches["main_branch"]:
-                            chat_branches["main_branch"].append(parent_message)
-
-                        # Add branch information
-                        chat_branches["branches"][branch_id] = {
-                            "parent_message": parent_message,
-                            "branch_start": branch["edit_branch"],
-                            "branch_messages": branch["branch_messages"],
-                            "branch_length": len(branch["branch_messages"]),
-                            "time_gap": branch["time_gap"],
-                            "is_edit_branch": True,
-                        }
-
-                        # Record edit point metadata
-                        chat_branches["edit_points"].append(
-                            {
-                                "parent_message_id": branch["parent_message"],
-                                "original_message": branch["original_branch"],
-                                "edit_message": branch["edit_branch"],
-                                "time_gap": branch["time_gap"],
-                            }
-                        )
-
-                if chat_branches["branches"]:
-                    response_data["branched_chats"][chat_name] = chat_branches
-                    response_data["stats"]["total_branched_chats"] += 1
-
-                    # Add detailed statistics
-                    response_data["stats"]["branching_structure"][chat_name] = {
-                        "total_branches": len(chat_branches["branches"]),
-                        "total_edit_points": len(chat_branches["edit_points"]),
-                        "branch_lengths": [
-                            data["branch_length"]
-                            for data in chat_branches["branches"].values()
-                        ],
-                        "average_time_gap": np.mean(
-                            [
-                                branch["time_gap"]
-                                for branch in chat_branches["branches"].values()
-                            ]
-                        ),
-                    }
+        # Branch analysis is done at processing time; data processed before
+        # that gets its report built and stored on first request
+        report_path = branch_report_path(data_dir)
+        if report_path is None:
+            message_index = get_message_index(data_dir)
+            if not message_index:
+                return jsonify({"error": "No message data found"}), 404
 
-                    response_data["stats"]["edit_branches"][chat_name] = {
-                        "count": len(edit_branches),
-                        "average_branch_length": np.mean(
-                            [len(branch["branch_messages"]) for branch in edit_branches]
-                        ),
-                        "time_gaps": [branch["time_gap"] for branch in edit_branches],
-                    }
+            print(f"\nAnalyzing {len(message_index)} messages for branches")
+            save_branch_report(build_branch_report(message_index.messages), data_dir)
+            report_path = branch_report_path(data_dir)
 
-        print("\n=== Branch Analysis Complete ===")
-        print(f"Total chats analyzed: {response_data['stats']['total_chats_analyzed']}")
-        print(
-            f"Chats with edit branches: {response_data['stats']['total_branched_chats']}"
-        )
-        print(
-            f"Total messages processed: {response_data['stats']['total_messages_processed']}"
-        )
-
-        return jsonify(response_data)
+        return send_file(report_path, mimetype="application/json")
 
     except Exception as e:
         error_msg = f"Error processing branched messages: {str(e)}"
@@ -524,23 +475,15 @@ def get_available_states():
         chat_type = request.args.get("type", "claude")
         data_dir = CLAUDE_DATA_DIR if chat_type == "claude" else CHATGPT_DATA_DIR
 
-        state_dir = os.path.join(data_dir, "states")
-        if not os.path.exists(state_dir):
-            return jsonify({"states": []})
-
-        states = []
-        for file in os.listdir(state_dir):
-            if file.startswith("state_") and file.endswith(".json"):
-                with open(os.path.join(state_dir, file), "r") as f:
-                    state_data = json.load(f)
-                    states.append(
-                        {
-                            "month_year": state_data["month_year"],
-                            "total_conversations": state_data["total_conversations"],
-                        }
-                    )
-
-        return jsonify({"states": sorted(states, key=lambda x: x["month_year"])})
+        # The processor keeps a manifest of all months; build it once for
+        # data processed before it existed
+        state_store = StateStore(data_dir)
+        if not state_store.exists():
+            if not os.path.isdir(state_store.states_dir):
+                return jsonify({"states": []})
+            state_store.rebuild()
+
+        return send_file(os.path.abspath(state_store.path), mimetype="application/json")
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -551,12 +494,16 @@ def get_state(month_year):
         chat_type = request.args.get("type", "claude")
         data_dir = CLAUDE_DATA_DIR if chat_type == "claude" else CHATGPT_DATA_DIR
 
-        state_file = os.path.join(data_dir, "states", f"state_{month_year}.json")
-        if not os.path.exists(state_file):
+        # With ?since=<month>, only the changes since that month (always JSON)
+        since = request.args.get("since")
+        if since:
+            payload = get_state_payload(data_dir, month_year, JSON_MIMETYPE, since=since)
+        else:
+            payload = get_state_payload(data_dir, month_year, negotiated_mimetype())
+        if payload is None:
             return jsonify({"error": "State not found"}), 404
 
-        with open(state_file, "r") as f:
-            return jsonify(json.load(f))
+        return encoded_payload_response(payload)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -1,28 +1,147 @@
-import queue
+import hashlib
+import os
 import threading
 import time
-import json
-import os
-from typing import Dict, Optional, Tuple
+import uuid
+from collections import deque
+from typing import BinaryIO, Dict, List, Optional
 
-import pandas as pd
+from config import PROCESSING_WORKERS, UPLOAD_STAGING_DIR
 from models import ProcessingTask
 import traceback
-from config import CHATGPT_DATA_DIR, CLAUDE_DATA_DIR
-from services.data_processing import process_chatgpt_messages, process_claude_messages, save_state, save_latest_state, process_data_by_month
+from services.data_processing import save_latest_state, process_data_by_month, month_labels
+from services.ingest import detect_chat_type, load_messages
+from services.message_store import MessageStore, messages_to_records
+from services.branch_analysis import build_branch_report, remove_branch_report, save_branch_report
+from services.topic_messages import build_topic_message_index
+from services.state_store import StateStore
+from services.task_registry import TaskRegistry
+from services.metrics import TASKS, timed_stage
+from services.progress import TaskProgress, get_progress_bus, report_progress, track_progress
+
+STAGING_CHUNK_SIZE = 1 << 20  # 1 MiB
+
+
+class TaskCancelled(Exception):
+    pass
+
+
+def task_final_event(task: ProcessingTask) -> Optional[dict]:
+    """Last progress event of a finished task, None while it is queued or running"""
+    if task.status == "completed":
+        return {"type": "complete"}
+    if task.status == "failed":
+        return {"type": "error", "message": task.error or "Processing failed"}
+    if task.status == "cancelled":
+        return {"type": "error", "message": "Task cancelled"}
+    return None
+
+
+# Staged uploads not yet handed to BackgroundProcessor.start_task, by path;
+# a finishing task never deletes a path listed here
+_staged_uploads: Dict[str, int] = {}
+_staged_uploads_lock = threading.Lock()
+
+
+def stage_upload(stream: BinaryIO, staging_dir: str = UPLOAD_STAGING_DIR) -> str:
+    """Save an upload under the SHA-256 of its content and return the path.
+
+    Concurrent uploads never share a file, and uploading the same export
+    twice reuses the staged copy. The path is reserved until start_task
+    takes it over, so a finished task with the same content cannot delete
+    it in between.
+    """
+    os.makedirs(staging_dir, exist_ok=True)
+    tmp_path = os.path.join(staging_dir, f"upload-{uuid.uuid4().hex}.tmp")
+    digest = hashlib.sha256()
+    with open(tmp_path, "wb") as f:
+        while True:
+            chunk = stream.read(STAGING_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            f.write(chunk)
+
+    file_path = os.path.join(staging_dir, f"{digest.hexdigest()}.json")
+    with _staged_uploads_lock:
+        _staged_uploads[file_path] = _staged_uploads.get(file_path, 0) + 1
+        os.replace(tmp_path, file_path)
+    return file_path
+
+
+def _unreserve_upload(file_path: str):
+    with _staged_uploads_lock:
+        count = _staged_uploads.pop(file_path, 0) - 1
+        if count > 0:
+            _staged_uploads[file_path] = count
 
 
 class BackgroundProcessor:
-    def __init__(self):
+    """Runs processing tasks on a pool of worker threads.
+
+    Tasks start in submission order, except that only one task per data dir
+    runs at a time; a queued task for another chat type may overtake it.
+    Queued tasks can be cancelled right away, running ones stop at the next
+    month boundary. Tasks are recorded in a TaskRegistry; on startup the
+    unfinished ones are queued again and resume after their last completed
+    month. A staged upload is deleted once no queued or running task uses it.
+    """
+
+    def __init__(self, workers: int = PROCESSING_WORKERS, registry: Optional[TaskRegistry] = None):
         self.tasks: Dict[str, ProcessingTask] = {}
-        self.task_queue = queue.Queue()
-        self.processing_thread = threading.Thread(
-            target=self._process_queue, daemon=True
-        )
-        self.processing_thread.start()
+        self.workers = max(1, workers)
+        self.registry = registry if registry is not None else TaskRegistry()
+        self.progress_bus = get_progress_bus()
+        self._pending: List[str] = []
+        self._busy_dirs = set()
+        self._recent_waits = deque(maxlen=100)
+        self._condition = threading.Condition()
+        self._recover()
+        self.processing_threads = [
+            threading.Thread(target=self._process_queue, daemon=True)
+            for _ in range(self.workers)
+        ]
+        for thread in self.processing_threads:
+            thread.start()
+
+    def _recover(self):
+        """Load recorded tasks and queue again the ones a restart interrupted"""
+        for task in self.registry.load():
+            self.tasks[task.task_id] = task
+            if task.status not in ("queued", "processing"):
+                continue
+            if task.cancel_requested:
+                task.status = "cancelled"
+                task.finished_at = time.time()
+            else:
+                print(f"Resuming task {task.task_id} ({task.chat_type})")
+                task.status = "queued"
+                task.started_at = None
+                self._pending.append(task.task_id)
+            self.registry.save(task)
+        for task in list(self.tasks.values()):
+            self._discard_upload(task.file_path)
+
+    def _discard_upload(self, file_path: str):
+        """Delete a staged upload once no queued or running task still reads it"""
+        staging_dir = os.path.abspath(UPLOAD_STAGING_DIR)
+        if os.path.dirname(os.path.abspath(file_path)) != staging_dir:
+            return
+        if any(
+            task.file_path == file_path and task.status in ("queued", "processing")
+            for task in self.tasks.values()
+        ):
+            return
+        with _staged_uploads_lock:
+            if file_path in _staged_uploads:
+                return
+            try:
+                os.remove(file_path)
+            except FileNotFoundError:
+                pass
 
     def start_task(self, file_path: str) -> str:
-        task_id = str(time.time())
+        task_id = uuid.uuid4().hex
         try:
             chat_type, data_dir = detect_chat_type(file_path)
             task = ProcessingTask(
@@ -31,111 +150,220 @@ class BackgroundProcessor:
                 progress=0.0,
                 chat_type=chat_type,
                 data_dir=data_dir,
+                task_id=task_id,
+                queued_at=time.time(),
             )
-            self.tasks[task_id] = task
-            self.task_queue.put((task_id, task))
+            self.registry.save(task)
+            self.progress_bus.publish(task_id, {"type": "progress", "step": "queued", "progress": 0.0})
+            with self._condition:
+                self.tasks[task_id] = task
+                self._pending.append(task_id)
+                self._condition.notify_all()
             return task_id
         except Exception as e:
             raise Exception(f"Error starting task: {str(e)}")
+        finally:
+            # The queued task (if any) now keeps the staged file alive
+            with self._condition:
+                _unreserve_upload(file_path)
+                self._discard_upload(file_path)
 
     def get_task_status(self, task_id: str) -> Optional[ProcessingTask]:
         return self.tasks.get(task_id)
 
+    def cancel_task(self, task_id: str) -> bool:
+        """Cancel a queued or running task; False when it already finished"""
+        with self._condition:
+            task = self.tasks.get(task_id)
+            if task is None or task.status in ("completed", "failed", "cancelled"):
+                return False
+            task.cancel_requested = True
+            if task_id in self._pending:
+                self._pending.remove(task_id)
+                task.status = "cancelled"
+                task.finished_at = time.time()
+                self.progress_bus.publish(task_id, task_final_event(task))
+                self._discard_upload(task.file_path)
+            self.registry.save(task)
+            return True
+
+    def queue_position(self, task_id: str) -> Optional[int]:
+        """1-based position among queued tasks, None when not queued"""
+        with self._condition:
+            if task_id in self._pending:
+                return self._pending.index(task_id) + 1
+        return None
+
+    def queue_stats(self) -> dict:
+        with self._condition:
+            now = time.time()
+            waits = [now - self.tasks[task_id].queued_at for task_id in self._pending]
+            return {
+                "workers": self.workers,
+                "queued": len(self._pending),
+                "running": sum(1 for t in self.tasks.values() if t.status == "processing"),
+                "oldest_wait_seconds": round(max(waits), 3) if waits else 0.0,
+                "average_start_wait_seconds": (
+                    round(sum(self._recent_waits) / len(self._recent_waits), 3)
+                    if self._recent_waits
+                    else 0.0
+                ),
+            }
+
+    def _next_task(self) -> ProcessingTask:
+        """Block until a queued task whose data dir is free can start"""
+        with self._condition:
+            while True:
+                for task_id in self._pending:
+                    task = self.tasks[task_id]
+                    if task.data_dir not in self._busy_dirs:
+                        self._pending.remove(task_id)
+                        self._busy_dirs.add(task.data_dir)
+                        task.status = "processing"
+                        task.started_at = time.time()
+                        self._recent_waits.append(task.started_at - task.queued_at)
+                        self.registry.save(task)
+                        return task
+                self._condition.wait()
+
+    def _release(self, task: ProcessingTask):
+        with self._condition:
+            task.finished_at = time.time()
+            self.registry.save(task)
+            self._busy_dirs.discard(task.data_dir)
+            self._discard_upload(task.file_path)
+            self._condition.notify_all()
+
+    def _check_cancelled(self, task: ProcessingTask):
+        if task.cancel_requested:
+            raise TaskCancelled()
+
     def _process_queue(self):
         while True:
+            task = self._next_task()
             try:
-                task_id, task = self.task_queue.get()
-                if task_id not in self.tasks:
-                    continue
-
-                task.status = "processing"
-                try:
-                    # Load and process the data based on chat type
-                    with open(task.file_path, "r") as f:
-                        data = json.load(f)
-
-                    # Process messages based on chat type
-                    messages = (
-                        process_chatgpt_messages(data)
-                        if task.chat_type == "chatgpt"
-                        else process_claude_messages(data)
-                    )
-
-                    # Create DataFrame and process month by month
-                    df = pd.DataFrame(messages)
-                    df["month_year"] = df["timestamp"].dt.strftime("%Y-%m")
-
-                    total_months = len(df["month_year"].unique())
-                    current_month = 0
-
-                    for update in process_data_by_month(df):
-                        current_month += 1
-                        task.progress = (current_month / total_months) * 100
-
-                        # Save state and files
-                        save_state(update, update["month_year"], task.data_dir)
-
-                        # Save monthly messages
-                        month_messages = df[df["month_year"] <= update["month_year"]]
-                        messages_json = month_messages.to_json(
-                            orient="records", date_format="iso"
-                        )
-
-                        # Save to appropriate directory
-                        states_dir = os.path.join(task.data_dir, "states")
-                        os.makedirs(states_dir, exist_ok=True)
-
-                        with open(
-                            os.path.join(
-                                states_dir, f'messages_{update["month_year"]}.json'
-                            ),
-                            "w",
-                        ) as f:
-                            f.write(messages_json)
-
-                        # Update latest state files
-                        save_latest_state(update, task.data_dir)
-
-                    task.completed = True
-                    task.status = "completed"
-
-                except Exception as e:
-                    task.error = str(e)
-                    task.status = "failed"
-                    print(f"Processing error: {str(e)}")
-                    traceback.print_exc()
+                with track_progress(TaskProgress(task.task_id, self.progress_bus)) as tracker:
+                    self._run_task(task, tracker)
+                task.completed = True
+                task.progress = 100.0
+                task.status = "completed"
+
+            except TaskCancelled:
+                task.status = "cancelled"
+                print(f"Task {task.task_id} cancelled")
 
             except Exception as e:
-                print(f"Error in processing thread: {str(e)}")
+                task.error = str(e)
+                task.status = "failed"
+                print(f"Processing error: {str(e)}")
                 traceback.print_exc()
-                continue
 
             finally:
-                self.task_queue.task_done()
+                self._release(task)
+                TASKS.inc(task.status)
+                self.progress_bus.publish(task.task_id, task_final_event(task))
 
-def detect_chat_type(file_path: str) -> Tuple[str, str]:
-    """
-    Detect whether the file contains Claude or ChatGPT chats and return the appropriate data directory
-    """
-    try:
-        with open(file_path, "r") as f:
-            data = json.load(f)
+    def _run_task(self, task: ProcessingTask, tracker: TaskProgress):
+        # Stream the export into a message DataFrame
+        report_progress("parse")
+        with timed_stage("ingest") as stage:
+            df = load_messages(task.file_path, task.chat_type)
+            stage.items = len(df)
+        self._check_cancelled(task)
+
+        # Process month by month
+        df["month_year"] = month_labels(df["timestamp"])
+
+        # Progress follows the month of each update, so skipped
+        # months and out-of-band workers do not distort it
+        month_positions = {
+            month: i + 1 for i, month in enumerate(sorted(df["month_year"].unique()))
+        }
+        total_months = len(month_positions)
+
+        # Each month's messages go into their own partition, once
+        message_store = MessageStore(task.data_dir)
+        with timed_stage("group", items=len(df)):
+            month_rows = df.groupby("month_year").indices
+        unsaved_months = sorted(month_rows)
+
+        # Monthly states as keyframes plus deltas, listed in a manifest
+        state_store = StateStore(task.data_dir)
+
+        # A run interrupted by a restart continues from its last saved month;
+        # states it wrote after that month are dropped
+        resume_month = self.registry.last_completed_month(task.task_id)
+        latest_update = state_store.truncate_after(resume_month) if resume_month else None
+        done_months = 0
+        if latest_update is not None:
+            print(f"Task {task.task_id}: {resume_month} already processed")
+            unsaved_months = [month for month in unsaved_months if month > resume_month]
+            done_months = sum(1 for month in month_positions if month <= resume_month)
+        else:
+            self.registry.clear_months(task.task_id)
+            message_store.reset()
+            state_store.reset()
+            remove_branch_report(task.data_dir)
+        tracker.set_months(list(month_positions), done=done_months)
+
+        month_started = time.time()
+        for update in process_data_by_month(df, resume_from=latest_update):
+            self._check_cancelled(task)
+            latest_update = update
+            # The window after the last month is left for the final stages
+            task.progress = (month_positions[update["month_year"]] / (total_months + 1)) * 100
+
+            # Save state and files
+            report_progress("save", month=update["month_year"])
+            with timed_stage("state_write", items=update["total_conversations"]):
+                state_store.save(update, time.time() - month_started)
+
+            # Save messages of this and any skipped earlier months
+            while unsaved_months and unsaved_months[0] <= update["month_year"]:
+                month = unsaved_months.pop(0)
+                with timed_stage("message_write", items=len(month_rows[month])):
+                    message_store.write_partition(month, df.iloc[month_rows[month]])
+
+            # Update latest state files
+            with timed_stage("state_write", items=update["total_conversations"]):
+                save_latest_state(update, task.data_dir)
+            self.registry.complete_month(task, update["month_year"])
+            month_started = time.time()
+
+        self._check_cancelled(task)
+        for month in unsaved_months:
+            with timed_stage("message_write", items=len(month_rows[month])):
+                message_store.write_partition(month, df.iloc[month_rows[month]])
+
+        # Edit-branch analysis served by /messages/branched
+        report_progress("branches")
+        messages = message_store.read()
+        with timed_stage("branch_analysis", items=len(messages)):
+            save_branch_report(
+                build_branch_report(messages_to_records(messages)), task.data_dir
+            )
 
-        # Check first item in the data
-        if isinstance(data, list):
-            first_item = data[0] if data else {}
+        # Message embeddings ranked by /content/identify-messages
+        if latest_update is not None:
+            report_progress("message_index")
+            with timed_stage("topic_index", items=len(messages)):
+                build_topic_message_index(
+                    messages,
+                    latest_update["titles"],
+                    latest_update["clusters"],
+                    message_store.version(),
+                    task.data_dir,
+                )
 
-            # ChatGPT format detection (has 'mapping' field)
-            if isinstance(first_item, dict) and "mapping" in first_item:
-                os.makedirs(CHATGPT_DATA_DIR, exist_ok=True)
-                return "chatgpt", CHATGPT_DATA_DIR
 
-            # Claude format detection (has 'chat_messages' field)
-            elif isinstance(first_item, dict) and "chat_messages" in first_item:
-                os.makedirs(CLAUDE_DATA_DIR, exist_ok=True)
-                return "claude", CLAUDE_DATA_DIR
+_processor: Optional[BackgroundProcessor] = None
+_processor_lock = threading.Lock()
 
-        raise ValueError("Unknown chat format")
 
-    except Exception as e:
-        raise Exception(f"Error detecting chat type: {str(e)}")
+def get_background_processor() -> BackgroundProcessor:
+    """The process-wide task scheduler, created on first use"""
+    global _processor
+    with _processor_lock:
+        if _processor is None:
+            _processor = BackgroundProcessor()
+        return _processor
@@ -0,0 +1,91 @@
+"""Compact binary encoding of point/cluster payloads.
+
+Layout (all integers little-endian)::
+
+    b"TGP1"                       magic
+    uint32                        header length in bytes
+    uint32[4, 2]                  (offset, byte length) of the four sections
+    header                        UTF-8 JSON with every other key of the payload
+    points      float32[n, 2]
+    clusters    int32[n]
+    title_ends  uint32[n]         end offset of every title in the blob
+    titles      UTF-8 blob
+
+Section offsets are relative to the start of the payload and 4-byte aligned,
+so clients can view the sections directly as typed arrays.
+"""
+import json
+import struct
+from typing import List
+
+import numpy as np
+
+BINARY_MIMETYPE = "application/vnd.tangent.points"
+MAGIC = b"TGP1"
+ARRAY_KEYS = ("points", "clusters", "titles")
+SECTIONS = ("points", "clusters", "title_ends", "titles")
+
+
+def _align(size: int) -> int:
+    return (size + 3) & ~3
+
+
+def encode_points_payload(data: dict) -> bytes:
+    """Encode a dict with points, clusters and titles (plus any JSON fields)"""
+    points = np.asarray(data.get("points") or [], dtype="<f4").reshape(-1, 2)
+    clusters = np.asarray(data.get("clusters") or [], dtype="<i4")
+    encoded_titles = [str(title).encode("utf-8") for title in data.get("titles") or []]
+    title_ends = np.cumsum([len(title) for title in encoded_titles], dtype="<u4")
+    title_blob = b"".join(encoded_titles)
+
+    sections = [
+        ("points", points.tobytes()),
+        ("clusters", clusters.tobytes()),
+        ("title_ends", title_ends.tobytes()),
+        ("titles", title_blob),
+    ]
+    header = json.dumps(
+        {key: value for key, value in data.items() if key not in ARRAY_KEYS},
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+    table = []
+    position = _align(len(MAGIC) + 4 + len(SECTIONS) * 8 + len(header))
+    for _, section in sections:
+        table.extend([position, len(section)])
+        position = _align(position + len(section))
+
+    out = bytearray(MAGIC + struct.pack(f"<I{len(table)}I", len(header), *table) + header)
+    for (_, section), offset in zip(sections, table[::2]):
+        out.extend(b"\0" * (offset - len(out)))
+        out.extend(section)
+    return bytes(out)
+
+
+def decode_points_payload(payload: bytes) -> dict:
+    """Inverse of encode_points_payload, returning the JSON-shaped dict"""
+    if payload[:4] != MAGIC:
+        raise ValueError("Not a points payload")
+    header_length, *table = struct.unpack_from(f"<I{len(SECTIONS) * 2}I", payload, 4)
+    header_start = len(MAGIC) + 4 + len(SECTIONS) * 8
+    fields = json.loads(payload[header_start : header_start + header_length].decode("utf-8"))
+    sections = {name: table[2 * i : 2 * i + 2] for i, name in enumerate(SECTIONS)}
+
+    def section(name, dtype):
+        offset, length = sections[name]
+        return np.frombuffer(payload, dtype=dtype, count=length // np.dtype(dtype).itemsize, offset=offset)
+
+    offset, length = sections["titles"]
+    blob = payload[offset : offset + length]
+    starts = 0
+    titles: List[str] = []
+    for end in section("title_ends", "<u4").tolist():
+        titles.append(blob[starts:end].decode("utf-8"))
+        starts = end
+
+    return {
+        **fields,
+        "points": section("points", "<f4").reshape(-1, 2).tolist(),
+        "clusters": section("clusters", "<i4").tolist(),
+        "titles": titles,
+    }
@@ -0,0 +1,270 @@
+import json
+import os
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from services.ingest import conversation_keys, conversation_labels
+
+BRANCH_REPORT_FILE = "branches.json"
+
+# Sibling replies further apart than this are treated as edits
+EDIT_GAP_SECONDS = 60
+
+
+def euler_tour(
+    children: Sequence[Sequence[int]], roots: Sequence[int]
+) -> Tuple[List[int], List[int], List[int]]:
+    """Iterative pre-order walk that gives every node a contiguous subtree range.
+
+    Returns ``(order, tin, tout)``: the subtree of node ``v`` is
+    ``order[tin[v]:tout[v]]``, visited in the same order a recursive walk would
+    visit it. Nodes not reachable from ``roots`` (cycles) start walks of their
+    own, and a node is never visited twice.
+    """
+    n_nodes = len(children)
+    tin = [-1] * n_nodes
+    tout = [-1] * n_nodes
+    order: List[int] = []
+
+    for start in list(roots) + list(range(n_nodes)):
+        if tin[start] != -1:
+            continue
+        tin[start] = len(order)
+        order.append(start)
+        stack = [(start, 0)]
+        while stack:
+            node, next_child = stack[-1]
+            node_children = children[node]
+            while next_child < len(node_children) and tin[node_children[next_child]] != -1:
+                next_child += 1
+            if next_child == len(node_children):
+                stack.pop()
+                tout[node] = len(order)
+                continue
+            stack[-1] = (node, next_child + 1)
+            child = node_children[next_child]
+            tin[child] = len(order)
+            order.append(child)
+            stack.append((child, 0))
+
+    return order, tin, tout
+
+
+def analyze_branches(messages: List[dict]) -> Dict[str, dict]:
+    """
+    Enhanced branch detection that specifically looks for edited message branches
+
+    Children of every message are sorted by timestamp first; each edit branch
+    then takes its messages from one Euler-tour range instead of re-walking
+    the subtree. Chats are keyed by chat id, so chats sharing a name are
+    analyzed separately; ``label`` holds the display name of each.
+    """
+    chats_with_branches = {}
+
+    # First pass: Group messages and build relationships
+    timestamps = pd.to_datetime(
+        pd.Series([msg.get("timestamp") for msg in messages], dtype=object),
+        format="ISO8601",
+        utc=True,
+        errors="coerce",
+    )
+    chat_ids = pd.Series([msg.get("chat_id") for msg in messages], dtype=object)
+    chat_names = pd.Series([msg.get("chat_name") for msg in messages], dtype=object)
+    keys = conversation_keys(chat_ids, chat_names)
+    labels = conversation_labels(chat_ids, chat_names)
+    for msg, timestamp, key, label in zip(messages, timestamps, keys, labels):
+        if not msg.get("chat_name"):
+            continue
+
+        if key not in chats_with_branches:
+            chats_with_branches[key] = {
+                "label": label,
+                "messages": [],
+                "message_ids": set(),
+                "parent_children": defaultdict(list),
+                "edit_branches": [],
+            }
+
+        chat_data = chats_with_branches[key]
+        msg_id = msg.get("message_id")
+        parent_id = msg.get("parent_message_id")
+
+        # Store message with additional metadata
+        msg_data = {
+            **msg,
+            "timestamp_obj": timestamp,
+            "children": [],
+            "is_branch_point": False,
+        }
+
+        chat_data["messages"].append(msg_data)
+
+        if msg_id:
+            chat_data["message_ids"].add(msg_id)
+            if parent_id:
+                chat_data["parent_children"][parent_id].append(len(chat_data["messages"]) - 1)
+
+    # Second pass: Identify edit branches
+    for chat_data in chats_with_branches.values():
+        chat_messages = chat_data["messages"]
+        parent_children = chat_data["parent_children"]
+        for children in parent_children.values():
+            children.sort(key=lambda i: chat_messages[i]["timestamp_obj"])
+
+        children = [
+            parent_children.get(msg.get("message_id"), []) if msg.get("message_id") else []
+            for msg in chat_messages
+        ]
+        roots = [
+            i
+            for i, msg in enumerate(chat_messages)
+            if msg.get("parent_message_id") not in chat_data["message_ids"]
+        ]
+        order, tin, tout = euler_tour(children, roots)
+
+        for parent_id, siblings in parent_children.items():
+            if len(siblings) < 2:
+                continue
+
+            # If there are significant time gaps between children, likely edit branches
+            for i in range(1, len(siblings)):
+                gap = (
+                    chat_messages[siblings[i]]["timestamp_obj"]
+                    - chat_messages[siblings[i - 1]]["timestamp_obj"]
+                ).total_seconds()
+                if gap > EDIT_GAP_SECONDS:
+                    edit = siblings[i]
+                    chat_data["edit_branches"].append(
+                        {
+                            "parent_message": parent_id,
+                            "original_branch": chat_messages[siblings[i - 1]],
+                            "edit_branch": chat_messages[edit],
+                            "time_gap": gap,
+                            "branch_messages": [
+                                chat_messages[j] for j in order[tin[edit] : tout[edit]]
+                            ],
+                        }
+                    )
+
+    return chats_with_branches
+
+
+def build_branch_report(messages: List[dict]) -> dict:
+    """Edit-branch analysis of all messages in the /messages/branched response format"""
+    branched_data = analyze_branches(messages)
+
+    report = {
+        "branched_chats": {},
+        "stats": {
+            "total_chats_analyzed": len(branched_data),
+            "total_branched_chats": 0,
+            "total_messages_processed": len(messages),
+            "branching_structure": {},
+            "edit_branches": {},
+        },
+    }
+
+    for chat_id, chat_data in branched_data.items():
+        chat_name = chat_data["label"]
+        edit_branches = chat_data["edit_branches"]
+        if not edit_branches:
+            continue
+
+        messages_by_id = {}
+        for msg in chat_data["messages"]:
+            messages_by_id.setdefault(msg.get("message_id"), msg)
+
+        chat_branches = {"chat_id": chat_id, "main_branch": [], "branches": {}, "edit_points": []}
+        main_branch_ids = set()
+
+        for idx, branch in enumerate(edit_branches):
+            # Find the parent message in the main conversation
+            parent_message = messages_by_id.get(branch["parent_message"])
+            if not parent_message:
+                continue
+
+            if branch["parent_message"] not in main_branch_ids:
+                main_branch_ids.add(branch["parent_message"])
+                chat_branches["main_branch"].append(parent_message)
+
+            chat_branches["branches"][f"branch_{idx + 1}"] = {
+                "parent_message": parent_message,
+                "branch_start": branch["edit_branch"],
+                "branch_messages": branch["branch_messages"],
+                "branch_length": len(branch["branch_messages"]),
+                "time_gap": branch["time_gap"],
+                "is_edit_branch": True,
+            }
+
+            # Record edit point metadata
+            chat_branches["edit_points"].append(
+                {
+                    "parent_message_id": branch["parent_message"],
+                    "original_message": branch["original_branch"],
+                    "edit_message": branch["edit_branch"],
+                    "time_gap": branch["time_gap"],
+                }
+            )
+
+        if not chat_branches["branches"]:
+            continue
+
+        report["branched_chats"][chat_name] = chat_branches
+        report["stats"]["total_branched_chats"] += 1
+        report["stats"]["branching_structure"][chat_name] = {
+            "total_branches": len(chat_branches["branches"]),
+            "total_edit_points": len(chat_branches["edit_points"]),
+            "branch_lengths": [
+                data["branch_length"] for data in chat_branches["branches"].values()
+            ],
+            "average_time_gap": float(
+                np.mean([data["time_gap"] for data in chat_branches["branches"].values()])
+            ),
+        }
+        report["stats"]["edit_branches"][chat_name] = {
+            "count": len(edit_branches),
+            "average_branch_length": float(
+                np.mean([len(branch["branch_messages"]) for branch in edit_branches])
+            ),
+            "time_gaps": [branch["time_gap"] for branch in edit_branches],
+        }
+
+    print(
+        f"Branch analysis: {report['stats']['total_branched_chats']} of "
+        f"{report['stats']['total_chats_analyzed']} chats have edit branches"
+    )
+    return report
+
+
+def _json_default(value):
+    if value is pd.NaT:
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def save_branch_report(report: dict, data_dir: str):
+    """Persist the branch report next to the other processed files"""
+    path = os.path.join(data_dir, BRANCH_REPORT_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(report, f, default=_json_default)
+    os.replace(tmp_path, path)
+
+
+def remove_branch_report(data_dir: str):
+    """Drop the persisted branch report when the messages it describes are replaced"""
+    try:
+        os.remove(os.path.join(data_dir, BRANCH_REPORT_FILE))
+    except FileNotFoundError:
+        pass
+
+
+def branch_report_path(data_dir: str) -> Optional[str]:
+    """Path of the persisted branch report, or None if it was never written"""
+    path = os.path.abspath(os.path.join(data_dir, BRANCH_REPORT_FILE))
+    return path if os.path.exists(path) else None
@@ -0,0 +1,139 @@
+import numpy as np
+
+# Rows per block when a points x clusters matrix is materialised
+STATS_BLOCK_SIZE = 4096
+
+
+def cluster_index(clusters):
+    """Map cluster labels to 0..k-1; returns (labels, per-point index, sizes)"""
+    labels, inverse = np.unique(np.asarray(clusters), return_inverse=True)
+    return labels, inverse, np.bincount(inverse, minlength=len(labels))
+
+
+def distance_sums_to_clusters(distances, inverse, sizes):
+    """Sum each row of ``distances`` over the members of every cluster.
+
+    ``inverse``/``sizes`` describe the clusters of the columns. Columns are
+    grouped by cluster and summed with one reduceat, which is O(rows x cols)
+    regardless of the number of clusters.
+    """
+    order = np.argsort(inverse, kind="stable")
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    return np.add.reduceat(distances[:, order], starts, axis=1)
+
+
+def coherence_from_distances(clusters, distance_matrix) -> dict:
+    """Mean pairwise similarity (1 - distance) inside each cluster of a dense matrix.
+
+    Only used when no embeddings are at hand; compute_cluster_stats gives the
+    same numbers for cosine distances without touching the matrix.
+    """
+    labels, inverse, sizes = cluster_index(clusters)
+    order = np.argsort(inverse, kind="stable")
+    bounds = np.concatenate([[0], np.cumsum(sizes)])
+
+    coherence = {}
+    for i, label in enumerate(labels):
+        if sizes[i] < 2:
+            coherence[label] = 1.0
+            continue
+        members = order[bounds[i] : bounds[i + 1]]
+        # The zero diagonal adds nothing, every pair is counted twice
+        total = distance_matrix[np.ix_(members, members)].sum()
+        coherence[label] = float(1.0 - total / (sizes[i] * (sizes[i] - 1)))
+    return coherence
+
+
+def reassign_outliers(clusters, distance_matrix):
+    """Move every outlier (-1) to the cluster with the lowest mean distance to it.
+
+    When every point is an outlier, each becomes a cluster of its own.
+    """
+    clusters = np.array(clusters)
+    outliers = np.where(clusters == -1)[0]
+    members = np.where(clusters != -1)[0]
+    if len(outliers) == 0:
+        return clusters
+    if len(members) == 0:
+        clusters[outliers] = np.arange(len(outliers))
+        return clusters
+
+    labels, inverse, sizes = cluster_index(clusters[members])
+    sums = distance_sums_to_clusters(
+        distance_matrix[np.ix_(outliers, members)], inverse, sizes
+    )
+    clusters[outliers] = labels[np.argmin(sums / sizes, axis=1)]
+    return clusters
+
+
+def compute_cluster_stats(embeddings, clusters, block_size=STATS_BLOCK_SIZE) -> dict:
+    """Per-cluster cosine statistics computed from cluster sum vectors.
+
+    For unit vectors x and a cluster sum S_c, x . S_c / s_c is the mean
+    similarity of x to the cluster, so coherence, silhouette and centroid
+    distances all follow from one points x clusters product (done in row
+    blocks) without any pairwise distance matrix.
+
+    Returns, per cluster label: ``coherence`` (mean pairwise similarity),
+    ``silhouette`` (mean cosine silhouette of its members), ``intra_spread``
+    (mean distance of members to the centroid), ``inter_spread`` (distance to
+    the nearest other centroid) and ``nearest_cluster``.
+    """
+    normalized = np.asarray(embeddings, dtype=np.float32)
+    normalized = normalized / np.maximum(np.linalg.norm(normalized, axis=1, keepdims=True), 1e-12)
+    labels, inverse, sizes = cluster_index(clusters)
+    n_clusters = len(labels)
+
+    # Rows grouped by cluster and summed with one reduceat; np.add.at is an
+    # unbuffered scatter and several times slower
+    order = np.argsort(inverse, kind="stable")
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    sums = np.add.reduceat(normalized[order], starts, axis=0, dtype=np.float64)
+    sum_norms = np.linalg.norm(sums, axis=1)
+    centroids = sums / np.maximum(sum_norms, 1e-12)[:, None]
+
+    pairs = sizes * (sizes - 1)
+    coherence = np.where(pairs > 0, (sum_norms**2 - sizes) / np.maximum(pairs, 1), 1.0)
+
+    silhouette = np.zeros(len(normalized))
+    centroid_distance = np.zeros(len(normalized))
+    for start in range(0, len(normalized), block_size):
+        block = normalized[start : start + block_size]
+        own = inverse[start : start + block_size]
+        rows = np.arange(len(block))
+
+        dots = block @ sums.T  # similarity sums to every cluster
+        centroid_distance[start : start + len(block)] = 1.0 - dots[rows, own] / np.maximum(sum_norms[own], 1e-12)
+        if n_clusters < 2:
+            continue
+
+        own_sizes = sizes[own]
+        a = 1.0 - (dots[rows, own] - 1.0) / np.maximum(own_sizes - 1, 1)
+        mean_distances = 1.0 - dots / sizes
+        mean_distances[rows, own] = np.inf
+        b = mean_distances.min(axis=1)
+        score = (b - a) / np.maximum(np.maximum(a, b), 1e-12)
+        silhouette[start : start + len(block)] = np.where(own_sizes > 1, score, 0.0)
+
+    intra_spread = np.bincount(inverse, weights=centroid_distance, minlength=n_clusters) / sizes
+    mean_silhouette = np.bincount(inverse, weights=silhouette, minlength=n_clusters) / sizes
+
+    if n_clusters > 1:
+        centroid_distances = 1.0 - centroids @ centroids.T
+        np.fill_diagonal(centroid_distances, np.inf)
+        nearest = np.argmin(centroid_distances, axis=1)
+        inter_spread = centroid_distances[np.arange(n_clusters), nearest]
+    else:
+        nearest = np.zeros(n_clusters, dtype=int)
+        inter_spread = np.zeros(n_clusters)
+
+    return {
+        label: {
+            "coherence": float(coherence[i]),
+            "silhouette": float(mean_silhouette[i]),
+            "intra_spread": float(intra_spread[i]),
+            "inter_spread": float(inter_spread[i]) if n_clusters > 1 else None,
+            "nearest_cluster": int(labels[nearest[i]]) if n_clusters > 1 else None,
+        }
+        for i, label in enumerate(labels)
+    }
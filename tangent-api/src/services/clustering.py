@@ -1,9 +1,16 @@
+import math
 import os
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
 import hdbscan
 from scipy.spatial.distance import pdist, squareform
 import numpy as np
+from config import TOPIC_CONCURRENCY, TOPIC_TIMEOUT
+from services.cluster_stats import coherence_from_distances, reassign_outliers
+from services.metrics import timed_stage
+from services.progress import report_progress
 from services.topic_generation import generate_topic_for_cluster
-from sklearn.base import defaultdict
 
 
 def perform_clustering(distance_matrix, n_points):
@@ -19,7 +26,8 @@ def perform_clustering(distance_matrix, n_points):
             prediction_data=False,
         )
 
-        clusters = clusterer.fit_predict(distance_matrix)
+        with timed_stage("hdbscan", items=n_points):
+            clusters = clusterer.fit_predict(distance_matrix)
 
         # Handle outliers
         outlier_mask = clusters == -1
@@ -34,34 +42,105 @@ def perform_clustering(distance_matrix, n_points):
 
 GENERATION_MODEL = os.getenv("GENERATION_MODEL", "qwen2.5-coder:7b")
 
+# Set in parallel month workers by share_topic_slots: a semaphore of
+# TOPIC_CONCURRENCY slots shared by all workers, and this worker's share of them
+_topic_slots = None
+_topic_concurrency = TOPIC_CONCURRENCY
 
-def generate_cluster_metadata(clusters, chat_titles, distance_matrix):
-    """Generate metadata for each cluster including topics and coherence scores"""
+
+def share_topic_slots(slots, concurrency):
+    """Run topic LLM calls of this process within ``slots`` shared with other processes"""
+    global _topic_slots, _topic_concurrency
+    _topic_slots = slots
+    _topic_concurrency = max(1, concurrency)
+
+
+def _generate_topic(titles, timeout, deadline):
+    if _topic_slots is None:
+        return generate_topic_for_cluster(titles, timeout)
+    if not _topic_slots.acquire(timeout=max(0.0, deadline - time.time())):
+        raise TimeoutError()
+    try:
+        return generate_topic_for_cluster(titles, timeout)
+    finally:
+        _topic_slots.release()
+
+
+def generate_cluster_topics(cluster_titles, concurrency=None, timeout=TOPIC_TIMEOUT):
+    """Generate topic labels for all clusters on a bounded worker pool.
+
+    Every label is a single LLM call bounded by ``timeout``, so the batch is
+    done within ``timeout`` per round of ``concurrency`` clusters; labels still
+    missing at that deadline fall back to "Miscellaneous".
+    """
+    cluster_ids = sorted(cluster_titles)
+    if not cluster_ids:
+        return {}
+
+    concurrency = concurrency or _topic_concurrency
+    start_time = time.time()
+    workers = max(1, min(concurrency, len(cluster_ids)))
+    deadline = start_time + timeout * math.ceil(len(cluster_ids) / workers)
+    topics = {}
+    pool = ThreadPoolExecutor(max_workers=workers)
+    try:
+        with timed_stage("topics", items=len(cluster_ids)):
+            futures = {
+                cluster_id: pool.submit(
+                    _generate_topic, cluster_titles[cluster_id], timeout, deadline
+                )
+                for cluster_id in cluster_ids
+            }
+            # Collect in cluster order so the output does not depend on completion order
+            for i, cluster_id in enumerate(cluster_ids):
+                try:
+                    topics[cluster_id] = futures[cluster_id].result(
+                        timeout=max(0.0, deadline - time.time())
+                    )
+                except TimeoutError:
+                    print(f"Topic for cluster {cluster_id} missed the deadline")
+                    topics[cluster_id] = "Miscellaneous"
+                except Exception as e:
+                    print(f"Error generating topic for cluster {cluster_id}: {str(e)}")
+                    topics[cluster_id] = "Miscellaneous"
+                report_progress("topics", done=i + 1, total=len(cluster_ids))
+    finally:
+        # Do not wait for calls that missed the deadline; their HTTP timeout ends them
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    elapsed = time.time() - start_time
+    print(
+        f"Generated {len(cluster_ids)} topic labels with {workers} workers "
+        f"in {elapsed:.2f}s ({elapsed / len(cluster_ids):.2f}s per cluster)"
+    )
+    return topics
+
+
+def generate_cluster_metadata(
+    clusters, chat_titles, distance_matrix, coherence_scores=None, cluster_stats=None
+):
+    """Generate metadata for each cluster including topics and coherence scores
+
+    Coherence is computed from ``distance_matrix`` unless precomputed
+    ``coherence_scores`` are given (the sparse backend has no dense matrix).
+    Extra per-cluster metrics from ``cluster_stats`` are copied into the result.
+    """
     # Group titles by cluster
     cluster_titles = defaultdict(list)
     for title, cluster_id in zip(chat_titles, clusters):
         cluster_titles[cluster_id].append(title)
 
+    topics = generate_cluster_topics(cluster_titles)
+    if coherence_scores is None:
+        coherence_scores = coherence_from_distances(clusters, distance_matrix)
+
     # Generate metadata for each cluster
     cluster_metadata = {}
-    for cluster_id, titles in cluster_titles.items():
-        # Generate topic label for cluster
-        topic = generate_topic_for_cluster(titles)
-
-        # Calculate coherence score based on pairwise distances
-        cluster_indices = np.where(clusters == cluster_id)[0]
-        coherence = 1.0  # Default for single-point clusters
-
-        if len(cluster_indices) > 1:
-            # Calculate average pairwise similarity within cluster
-            cluster_distances = distance_matrix[cluster_indices][:, cluster_indices]
-            coherence = np.mean(
-                [
-                    1 - cluster_distances[i, j]
-                    for i in range(len(cluster_indices))
-                    for j in range(i + 1, len(cluster_indices))
-                ]
-            )
+    for cluster_id in sorted(cluster_titles):
+        titles = cluster_titles[cluster_id]
+        topic = topics[cluster_id]
+
+        coherence = coherence_scores.get(cluster_id, 1.0)
 
         cluster_metadata[str(cluster_id)] = {
             "topic": topic,
@@ -69,27 +148,19 @@ def generate_cluster_metadata(clusters, chat_titles, distance_matrix):
             "coherence": float(coherence),  # Ensure coherence is JSON serializable
             "reflection": "",  # Initialize empty reflection that can be populated later
         }
+        if cluster_stats and cluster_id in cluster_stats:
+            stats = cluster_stats[cluster_id]
+            cluster_metadata[str(cluster_id)].update(
+                {
+                    "silhouette": stats["silhouette"],
+                    "intra_spread": stats["intra_spread"],
+                    "inter_spread": stats["inter_spread"],
+                }
+            )
 
     return cluster_metadata
 
 
 def handle_outliers(clusters, distance_matrix):
     """Handle outlier points in clustering"""
-    outlier_indices = np.where(clusters == -1)[0]
-    valid_clusters = np.unique(clusters[clusters != -1])
-
-    for idx in outlier_indices:
-        if len(valid_clusters) > 0:
-            distances_to_clusters = {}
-            for valid_cluster in valid_clusters:
-                cluster_points = clusters == valid_cluster
-                avg_distance = np.mean(distance_matrix[idx, cluster_points])
-                distances_to_clusters[valid_cluster] = avg_distance
-
-            nearest_cluster = min(distances_to_clusters.items(), key=lambda x: x[1])[0]
-            clusters[idx] = nearest_cluster
-        else:
-            new_cluster = max(clusters) + 1 if len(clusters) > 0 else 0
-            clusters[idx] = new_cluster
-
-    return clusters
+    return reassign_outliers(clusters, distance_matrix)
@@ -0,0 +1,45 @@
+from collections import deque
+from typing import List, Optional, Sequence, Tuple
+
+
+def assign_branches(
+    node_ids: Sequence[str], parent_ids: Sequence[Optional[str]]
+) -> Tuple[List[Optional[str]], List[int], List[int]]:
+    """Assign branch ids to the nodes of one conversation tree in O(n).
+
+    Builds the parent -> children index once and walks it breadth-first with a
+    deque, so deep threads never touch the recursion limit. Nodes whose parent
+    is missing or unknown start a tree of their own. The main line is branch
+    "0"; when a node has several children, child ``i`` starts branch
+    ``"<parent branch>.<i>"``, and an only child stays on its parent's branch.
+
+    Returns the branch id per node (None for nodes only reachable through a
+    cycle), the visiting order, and the number of children per node.
+    """
+    index = {node_id: i for i, node_id in enumerate(node_ids)}
+    children: List[List[int]] = [[] for _ in node_ids]
+    roots = []
+    for i, parent_id in enumerate(parent_ids):
+        parent = index.get(parent_id) if parent_id else None
+        if parent is None or parent == i:
+            roots.append(i)
+        else:
+            children[parent].append(i)
+
+    branches: List[Optional[str]] = [None] * len(node_ids)
+    order = []
+    queue = deque((root, "0") for root in roots)
+    while queue:
+        node, branch = queue.popleft()
+        branches[node] = branch
+        order.append(node)
+
+        node_children = children[node]
+        if len(node_children) > 1:
+            queue.extend(
+                (child, f"{branch}.{idx}") for idx, child in enumerate(node_children)
+            )
+        elif node_children:
+            queue.append((node_children[0], branch))
+
+    return branches, order, [len(node_children) for node_children in children]
@@ -3,34 +3,24 @@ import os
 import traceback
 import numpy as np
 import pandas as pd
-from collections import defaultdict 
-from scipy.spatial.distance import pdist, squareform  # Move import here to be explicit
+from scipy.spatial.distance import cdist, pdist, squareform  # Move import here to be explicit
 import umap
-from config import CLAUDE_DATA_DIR, CHATGPT_DATA_DIR
-from typing import List, Tuple
+from config import (
+    PIPELINE_MODE,
+    PIPELINE_WORKERS,
+    SPARSE_CLUSTERING_MIN_POINTS,
+)
+from typing import Iterable
 from services.embedding import get_embeddings
-from scipy.spatial.distance import squareform
 from services.clustering import perform_clustering, generate_cluster_metadata
-
-
-def save_state(state_data, month_year, data_dir):
-    """Save a specific state with timestamp to the appropriate directory"""
-    state_dir = os.path.join(data_dir, "states")
-    os.makedirs(state_dir, exist_ok=True)
-
-    state_file = os.path.join(state_dir, f"state_{month_year}.json")
-    with open(state_file, "w") as f:
-        json.dump(
-            {
-                "month_year": month_year,
-                "points": state_data["points"],
-                "clusters": state_data["clusters"],
-                "titles": state_data["titles"],
-                "topics": state_data["topics"],
-                "total_conversations": state_data["total_conversations"],
-            },
-            f,
-        )
+from services.cluster_stats import compute_cluster_stats
+from services.conversation_tree import assign_branches
+from services.ingest import MessageColumns, conversation_labels
+from services.layout import LayoutReducer, align_to_previous
+from services.parallel_months import process_months_in_pool
+from services.metrics import timed_stage
+from services.progress import report_progress
+from services.sparse_clustering import perform_sparse_clustering
 
 
 def save_latest_state(update, data_dir):
@@ -45,177 +35,85 @@ def save_latest_state(update, data_dir):
         json.dump(update["titles"], f)
 
 
-def process_claude_messages(data: List[dict]) -> List[dict]:
-    messages = []
-    for chat in data:
-        chat_name = chat.get("name", "Unnamed Chat")
-        chat_id = chat.get("uuid", "")
-        chat_messages = chat.get("chat_messages", [])
-        children_by_parent = defaultdict(list)
-        messages_dict = {}
-
-        for msg in chat_messages:
-            msg_id = msg.get("uuid", "")
-            parent_id = msg.get("parent", None)
-
-            if msg_id:
-                messages_dict[msg_id] = msg
-                if parent_id:
-                    children_by_parent[parent_id].append(msg_id)
-
-        for msg_id, msg in messages_dict.items():
-            timestamp = pd.to_datetime(msg.get("created_at"))
-            if pd.isna(timestamp):
-                continue
-
-            parent_id = msg.get("parent")
-            has_multiple_children = len(children_by_parent.get(msg_id, [])) > 1
-
-            processed_msg = {
-                "chat_name": chat_name,
-                "chat_id": chat_id,
-                "message_id": msg_id,
-                "parent_message_id": parent_id,
-                "branch_id": "0",  # Will be updated during tree traversal
-                "sender": msg.get("sender", "unknown"),
-                "timestamp": timestamp,
-                "text": msg.get("text", ""),
-                "is_branch_point": has_multiple_children,
-            }
-
-            messages.append(processed_msg)
-
-    # Second pass: Assign proper branch IDs through tree traversal
-    chats = defaultdict(list)
-    for msg in messages:
-        chats[msg["chat_name"]].append(msg)
-
-    processed_messages = []
-    for chat_messages in chats.values():
-        roots = [msg for msg in chat_messages if not msg["parent_message_id"]]
-        for root in roots:
-            branch_queue = [(root, "0")]
-            while branch_queue:
-                current_msg, current_branch = branch_queue.pop(0)
-                current_msg["branch_id"] = current_branch
-                processed_messages.append(current_msg)
-
-                children = [
-                    msg
-                    for msg in chat_messages
-                    if msg["parent_message_id"] == current_msg["message_id"]
-                ]
-
-                if len(children) > 1:
-                    for idx, child in enumerate(children):
-                        branch_queue.append((child, f"{current_branch}.{idx}"))
-                elif children:
-                    branch_queue.append((children[0], current_branch))
+def process_claude_conversation(chat: dict, columns: MessageColumns):
+    """Parse one Claude chat and append its messages to ``columns``"""
+    chat_name = chat.get("name", "Unnamed Chat")
+    chat_id = chat.get("uuid", "")
+    chat_messages = [msg for msg in chat.get("chat_messages", []) if msg.get("uuid")]
+
+    branches, order, child_counts = assign_branches(
+        [msg["uuid"] for msg in chat_messages],
+        [msg.get("parent") for msg in chat_messages],
+    )
+
+    for i in order:
+        msg = chat_messages[i]
+        columns.append(
+            chat_name=chat_name,
+            chat_id=chat_id,
+            message_id=msg["uuid"],
+            parent_message_id=msg.get("parent"),
+            branch_id=branches[i],
+            sender=msg.get("sender", "unknown"),
+            timestamp=msg.get("created_at"),
+            text=msg.get("text", ""),
+            is_branch_point=child_counts[i] > 1,
+        )
 
-    return processed_messages
 
+def process_chatgpt_conversation(conversation: dict, columns: MessageColumns):
+    """Parse one ChatGPT conversation and append its messages to ``columns``"""
+    conv_title = conversation.get("title", "Untitled Chat")
+    conv_id = conversation.get("id", "")
 
-def process_chatgpt_messages(data: List[dict]) -> List[dict]:
-    messages = []
-    for conversation in data:
-        conv_title = conversation.get("title", "Untitled Chat")
-        conv_id = conversation.get("id", "")
-
-        if "mapping" in conversation:
-            mapping = conversation["mapping"]
-            for node_id, node_data in mapping.items():
-                message_data = node_data.get("message", {})
-                if not message_data:
-                    continue
+    # The tree is built over every node, including the message-less root, so
+    # skipped nodes do not cut their descendants off their branch
+    mapping = conversation.get("mapping") or {}
+    node_ids = list(mapping)
+    branches, order, child_counts = assign_branches(
+        node_ids, [mapping[node_id].get("parent") for node_id in node_ids]
+    )
 
-                created_at = message_data.get("create_time")
-                try:
-                    if isinstance(created_at, (int, float)):
-                        timestamp = pd.to_datetime(created_at, unit="s")
-                    else:
-                        timestamp = pd.to_datetime(created_at)
+    for i in order:
+        node_data = mapping[node_ids[i]]
+        message_data = node_data.get("message", {})
+        if not message_data:
+            continue
 
-                    if pd.isna(timestamp):
-                        continue
-                except (ValueError, TypeError):
-                    continue
+        content = message_data.get("content", {})
+        if isinstance(content, dict) and "parts" in content:
+            text = " ".join(str(part) for part in content["parts"])
+        else:
+            text = str(content)
 
-                content = message_data.get("content", {})
-                if isinstance(content, dict) and "parts" in content:
-                    text = " ".join(str(part) for part in content["parts"])
-                else:
-                    text = str(content)
-
-                sender_role = message_data.get("author", {}).get("role")
-                sender = "human" if sender_role == "user" else "assistant"
-
-                messages.append(
-                    {
-                        "chat_name": conv_title,
-                        "chat_id": conv_id,
-                        "message_id": message_data.get("id", ""),
-                        "parent_message_id": node_data.get("parent"),
-                        "branch_id": "0",  # Default branch ID
-                        "sender": sender,
-                        "timestamp": timestamp,  # This will be a pandas datetime object
-                        "text": text,
-                    }
-                )
+        sender_role = message_data.get("author", {}).get("role")
+        sender = "human" if sender_role == "user" else "assistant"
+
+        columns.append(
+            chat_name=conv_title,
+            chat_id=conv_id,
+            message_id=message_data.get("id", ""),
+            parent_message_id=node_data.get("parent"),
+            branch_id=branches[i],
+            sender=sender,
+            timestamp=message_data.get("create_time"),
+            text=text,
+            is_branch_point=child_counts[i] > 1,
+        )
 
-    if messages:
-        df = pd.DataFrame(messages)
-        df["timestamp"] = pd.to_datetime(df["timestamp"])
-        df = df.sort_values("timestamp")
-        messages = df.to_dict("records")
 
-    return messages
+def process_claude_messages(data: Iterable[dict]) -> pd.DataFrame:
+    columns = MessageColumns()
+    for chat in data:
+        process_claude_conversation(chat, columns)
+    return columns.to_dataframe()
 
 
-def traverse_tree(
-    node: dict,
-    conv_title: str,
-    conv_id: str,
-    messages: List[dict],
-    branch_id: str = "0",
-):
-    message_data = node["message"]
-    if not message_data or "content" not in message_data:
-        return
-    content = message_data.get("content", {})
-    if isinstance(content, dict) and "parts" in content:
-        text = " ".join(str(part) for part in content["parts"])
-    else:
-        text = str(content)
-    try:
-        created_at = message_data.get("create_time")
-        if isinstance(created_at, (int, float)):
-            timestamp = pd.to_datetime(created_at, unit="s")
-        else:
-            timestamp = pd.to_datetime(created_at)
-        if pd.isna(timestamp):
-            return
-        sender_role = message_data.get("author", {}).get("role")
-        messages.append(
-            {
-                "chat_name": conv_title,
-                "chat_id": conv_id,
-                "message_id": message_data.get("id", ""),
-                "parent_message_id": node["parent_id"],
-                "branch_id": branch_id,
-                "sender": "human" if sender_role == "user" else "assistant",
-                "timestamp": timestamp,
-                "text": text,
-            }
-        )
-        if len(node["children"]) > 1:
-            for idx, child in enumerate(node["children"]):
-                traverse_tree(
-                    child, conv_title, conv_id, messages, f"{branch_id}.{idx}"
-                )
-        elif node["children"]:
-            traverse_tree(node["children"][0], conv_title, conv_id, messages, branch_id)
-    except (ValueError, TypeError) as e:
-        print(f"Error processing message: {e}")
+def process_chatgpt_messages(data: Iterable[dict]) -> pd.DataFrame:
+    columns = MessageColumns()
+    for conversation in data:
+        process_chatgpt_conversation(conversation, columns)
+    return columns.to_dataframe()
 
 
 def identify_struggle_messages(df: pd.DataFrame) -> pd.DataFrame:
@@ -240,36 +138,17 @@ def identify_struggle_messages(df: pd.DataFrame) -> pd.DataFrame:
     return struggle_df
 
 
-def detect_chat_type(file_path: str) -> Tuple[str, str]:
-    """
-    Detect whether the file contains Claude or ChatGPT chats and return the appropriate data directory
-    """
-    try:
-        with open(file_path, "r") as f:
-            data = json.load(f)
+def month_labels(timestamps: pd.Series) -> pd.Series:
+    """Vectorized "%Y-%m" labels for a datetime column"""
+    return timestamps.dt.to_period("M").astype(str)
 
-        # Check first item in the data
-        if isinstance(data, list):
-            first_item = data[0] if data else {}
 
-            # ChatGPT format detection (has 'mapping' field)
-            if isinstance(first_item, dict) and "mapping" in first_item:
-                os.makedirs(CHATGPT_DATA_DIR, exist_ok=True)
-                return "chatgpt", CHATGPT_DATA_DIR
+def process_data_by_month(df, mode=PIPELINE_MODE, resume_from=None):
+    """Process data month by month and yield updates.
 
-            # Claude format detection (has 'chat_messages' field)
-            elif isinstance(first_item, dict) and "chat_messages" in first_item:
-                os.makedirs(CLAUDE_DATA_DIR, exist_ok=True)
-                return "claude", CLAUDE_DATA_DIR
-
-        raise ValueError("Unknown chat format")
-
-    except Exception as e:
-        raise Exception(f"Error detecting chat type: {str(e)}")
-
-
-def process_data_by_month(df):
-    """Process data month by month and yield updates."""
+    ``resume_from`` is the saved state of the last month a previous run
+    completed; only the months after it are processed.
+    """
     try:
         # Ensure timestamp column is datetime
         df["timestamp"] = pd.to_datetime(df["timestamp"])
@@ -278,7 +157,13 @@ def process_data_by_month(df):
         df = df.dropna(subset=["timestamp"])
 
         # Add month_year column with consistent format
-        df["month_year"] = df["timestamp"].dt.strftime("%Y-%m")
+        if "month_year" not in df:
+            df = df.assign(month_year=month_labels(df["timestamp"]))
+
+        # Branches are grouped per conversation id, under a display name
+        # that stays unique when several chats share a name
+        if "chat_label" not in df:
+            df = df.assign(chat_label=conversation_labels(df["chat_id"], df["chat_name"]))
 
         # Sort by month_year
         months = sorted(df["month_year"].unique())
@@ -286,75 +171,351 @@ def process_data_by_month(df):
         if not months:
             raise ValueError("No valid months found in data")
 
-        accumulated_data = pd.DataFrame()
+        print(f"Processing {len(months)} months of data ({mode} mode)...")
+        if resume_from is not None:
+            print(f"Resuming after {resume_from['month_year']}")
+        if mode == "full":
+            yield from _process_months_full(df, months, resume_from)
+        elif mode == "parallel":
+            yield from _process_months_parallel(df, months, resume_from=resume_from)
+        else:
+            yield from _process_months_incremental(df, months, resume_from)
+
+    except Exception as e:
+        print(f"Error in process_data_by_month: {str(e)}")
+        traceback.print_exc()
+        raise Exception(f"Error in process_data_by_month: {str(e)}")
 
-        print(f"Processing {len(months)} months of data...")
-        for month in months:
-            try:
-                # Get data for current month and all previous months
-                month_mask = df["month_year"] <= month
-                accumulated_data = df[month_mask].copy()
 
-                # Group messages by chat and branch for this time period
-                chat_messages = accumulated_data.groupby(["chat_name", "branch_id"])[
+def _process_months_full(df, months, resume_from=None):
+    """Recompute every month from the cumulative data up to that month"""
+    for month in months:
+        if resume_from is not None and month <= resume_from["month_year"]:
+            continue
+        try:
+            # Get data for current month and all previous months
+            month_mask = df["month_year"] <= month
+            accumulated_data = df[month_mask].copy()
+
+            # Group messages by chat and branch for this time period
+            with timed_stage("group", items=len(accumulated_data)):
+                chat_messages = accumulated_data.groupby(["chat_label", "branch_id"])[
                     "text"
                 ].agg(list)
-                chat_titles = [
-                    "{} (Branch {})".format(chat_name, branch_id)
-                    for chat_name, branch_id in chat_messages.index
-                ]
+            chat_titles = [
+                "{} (Branch {})".format(chat_label, branch_id)
+                for chat_label, branch_id in chat_messages.index
+            ]
+
+            if len(chat_titles) < 2:
+                print(f"Skipping month {month} - insufficient data points")
+                continue
+
+            print(f"Processing month {month} with {len(chat_titles)} chats...")
+            # Process the month's data and yield update
+            update_data = process_single_month(chat_titles, month)
+            if update_data:
+                yield update_data
+            else:
+                print(f"Warning: month {month} produced no update and was skipped")
+
+        except Exception as e:
+            print(f"Error processing month {month}: {str(e)}")
+            traceback.print_exc()
+            continue
+
+
+def _process_months_incremental(df, months, resume_from=None):
+    """Carry titles, embeddings and distances forward, only embedding new branches.
+
+    Titles keep the order in which their branch first appeared, so each month's
+    arrays extend the previous month's. A month that adds no new branch reuses
+    the previous update unchanged. When resuming, the carried state is rebuilt
+    from ``resume_from`` (embeddings come from the embedding cache) and the
+    months up to it are only scanned for their branches.
+    """
+    chat_titles = []
+    seen_branches = set()
+    pending_branches = []
+    embeddings = None
+    distance_matrix = None
+    previous_update = None
+    layout_reducer = LayoutReducer()
+
+    with timed_stage("group", items=len(df)):
+        branches_by_month = (
+            df[["month_year", "chat_label", "branch_id"]]
+            .drop_duplicates()
+            .sort_values(["month_year", "chat_label", "branch_id"])
+            .groupby("month_year")
+        )
 
-                if len(chat_titles) < 2:
-                    print(f"Skipping month {month} - insufficient data points")
+    for month in months:
+        try:
+            month_branches = branches_by_month.get_group(month)
+            for branch in zip(month_branches["chat_label"], month_branches["branch_id"]):
+                if branch not in seen_branches:
+                    seen_branches.add(branch)
+                    pending_branches.append(branch)
+
+            if resume_from is not None:
+                if month < resume_from["month_year"]:
+                    continue
+                chat_titles = list(resume_from["titles"])
+                embedded = set(chat_titles)
+                pending_branches = [
+                    branch
+                    for branch in pending_branches
+                    if "{} (Branch {})".format(*branch) not in embedded
+                ]
+                embeddings, distance_matrix = _restore_embeddings(chat_titles)
+                layout_reducer.previous = dict(
+                    zip(chat_titles, np.array(resume_from["points"], dtype=float))
+                )
+                previous_update = resume_from
+                resumed_month, resume_from = resume_from["month_year"], None
+                if month == resumed_month:
                     continue
 
-                print(f"Processing month {month} with {len(chat_titles)} chats...")
-                # Process the month's data and yield update
-                update_data = process_single_month(chat_titles, month)
-                if update_data:
-                    yield update_data
+            if not pending_branches and previous_update:
+                print(f"Month {month} adds no new chats, reusing previous state")
+                # Nothing is refitted, so the month has no layout stats
+                previous_update = {**previous_update, "month_year": month, "layout": None}
+                yield previous_update
+                continue
 
-            except Exception as e:
-                print(f"Error processing month {month}: {str(e)}")
-                traceback.print_exc()
+            if len(chat_titles) + len(pending_branches) < 2:
+                # Pending branches are embedded together with next month's
+                print(f"Skipping month {month} - insufficient data points")
                 continue
 
-    except Exception as e:
-        print(f"Error in process_data_by_month: {str(e)}")
-        traceback.print_exc()
-        raise Exception(f"Error in process_data_by_month: {str(e)}")
+            new_titles = [
+                "{} (Branch {})".format(chat_label, branch_id)
+                for chat_label, branch_id in pending_branches
+            ]
+            print(
+                f"Processing month {month}: {len(new_titles)} new of "
+                f"{len(chat_titles) + len(new_titles)} chats..."
+            )
+            report_progress("embed", month=month)
+            new_embeddings = get_embeddings(new_titles)
+            if new_embeddings is None:
+                print(f"Warning: embeddings failed for month {month}, retrying next month")
+                continue
+            new_embeddings = np.array(new_embeddings)
+
+            if embeddings is None:
+                embeddings = new_embeddings
+            else:
+                embeddings = np.vstack([embeddings, new_embeddings])
+
+            # The dense matrix is only kept while the dense clustering path is used
+            if len(embeddings) >= SPARSE_CLUSTERING_MIN_POINTS:
+                distance_matrix = None
+            elif distance_matrix is None:
+                with timed_stage("pdist", items=len(embeddings)):
+                    distance_matrix = squareform(pdist(embeddings, metric="cosine"))
+            else:
+                with timed_stage("pdist", items=len(new_embeddings)):
+                    distance_matrix = extend_distance_matrix(
+                        distance_matrix, embeddings[: -len(new_embeddings)], new_embeddings
+                    )
+            chat_titles = chat_titles + new_titles
+            pending_branches = []
+
+            update_data = process_single_month(
+                chat_titles,
+                month,
+                embeddings=embeddings,
+                distance_matrix=distance_matrix,
+                layout_reducer=layout_reducer,
+            )
+            if update_data:
+                previous_update = update_data
+                yield update_data
+            else:
+                print(f"Warning: month {month} produced no update and was skipped")
+
+        except Exception as e:
+            print(f"Error processing month {month}: {str(e)}")
+            traceback.print_exc()
+            continue
+
+
+def _restore_embeddings(chat_titles):
+    """Embeddings and (dense path only) distance matrix of already processed titles"""
+    embeddings = get_embeddings(chat_titles)
+    if embeddings is None:
+        raise ValueError("Embedding retrieval failed while resuming")
+    embeddings = np.array(embeddings)
+    if len(embeddings) >= SPARSE_CLUSTERING_MIN_POINTS:
+        return embeddings, None
+    with timed_stage("pdist", items=len(embeddings)):
+        return embeddings, squareform(pdist(embeddings, metric="cosine"))
+
+
+def plan_incremental_months(df, months):
+    """Titles in order of first appearance, and per month how many of them it covers.
+
+    Follows the same rules as _process_months_incremental: a month without new
+    branches reuses the previous update (``None``), and months with fewer than
+    two branches so far are left out.
+    """
+    chat_titles = []
+    seen_branches = set()
+    plan = []
+
+    with timed_stage("group", items=len(df)):
+        branches_by_month = (
+            df[["month_year", "chat_label", "branch_id"]]
+            .drop_duplicates()
+            .sort_values(["month_year", "chat_label", "branch_id"])
+            .groupby("month_year")
+        )
+    for month in months:
+        month_branches = branches_by_month.get_group(month)
+        n_before = len(chat_titles)
+        for branch in zip(month_branches["chat_label"], month_branches["branch_id"]):
+            if branch not in seen_branches:
+                seen_branches.add(branch)
+                chat_titles.append("{} (Branch {})".format(*branch))
+
+        if len(chat_titles) == n_before and plan:
+            plan.append((month, None))
+        elif len(chat_titles) >= 2:
+            plan.append((month, len(chat_titles)))
+
+    return chat_titles, plan
+
+
+def _process_months_parallel(df, months, workers=PIPELINE_WORKERS, resume_from=None):
+    """Fit the incremental months independently in a process pool.
+
+    All titles are embedded up front and shared with the workers; updates come
+    back in month order, each layout aligned to the previous month's so points
+    do not jump between frames.
+    """
+    chat_titles, plan = plan_incremental_months(df, months)
+    if resume_from is not None:
+        plan = [(month, n_titles) for month, n_titles in plan if month > resume_from["month_year"]]
+    workers = min(workers, sum(1 for _, n_titles in plan if n_titles))
+    if workers < 2:
+        # Worker start-up (imports, JIT compilation) only pays off with parallelism
+        yield from _process_months_incremental(df, months, resume_from)
+        return
+
+    report_progress("embed")
+    embeddings = get_embeddings(chat_titles)
+    if embeddings is None:
+        raise ValueError("Embedding retrieval failed")
+    embeddings = np.array(embeddings)
+
+    print(f"Fitting {len(plan)} months with {workers} worker processes...")
+
+    previous_update = resume_from
+    for month, update_data, error in process_months_in_pool(
+        chat_titles, embeddings, plan, workers
+    ):
+        if error:
+            print(f"Error processing month {month}: {error}")
+            continue
+
+        if update_data is None:
+            if previous_update:
+                print(f"Month {month} adds no new chats, reusing previous state")
+                # Nothing is refitted, so the month has no layout stats
+                previous_update = {**previous_update, "month_year": month, "layout": None}
+                yield previous_update
+            else:
+                print(f"Warning: month {month} produced no update and was skipped")
+            continue
 
+        # Titles extend the previous month's, so its points are a prefix
+        if previous_update and len(previous_update["points"]) >= 3:
+            points = np.array(update_data["points"])
+            previous_points = np.array(previous_update["points"])
+            n_shared = len(previous_points)
+            update_data["points"] = align_to_previous(
+                points, points[:n_shared], previous_points
+            ).tolist()
 
-def process_single_month(chat_titles, month):
+        previous_update = update_data
+        yield update_data
+
+
+def extend_distance_matrix(distance_matrix, embeddings, new_embeddings):
+    """Grow a cosine distance matrix by the rows and columns of new points"""
+    n_old, n_new = len(embeddings), len(new_embeddings)
+    cross = cdist(new_embeddings, embeddings, metric="cosine")
+
+    extended = np.empty((n_old + n_new, n_old + n_new), dtype=distance_matrix.dtype)
+    extended[:n_old, :n_old] = distance_matrix
+    extended[n_old:, :n_old] = cross
+    extended[:n_old, n_old:] = cross.T
+    extended[n_old:, n_old:] = squareform(pdist(new_embeddings, metric="cosine"))
+    return extended
+
+
+def process_single_month(
+    chat_titles, month, embeddings=None, distance_matrix=None, layout_reducer=None
+):
     try:
         print(f"Starting processing for month {month} with {len(chat_titles)} chats")
 
-        # Get embeddings
-        print(f"Fetching embeddings for {len(chat_titles)} titles...")
-        embeddings = get_embeddings(chat_titles)
         if embeddings is None:
-            print("Embeddings retrieval failed.")
-            return None
-        print("Embeddings retrieved successfully.")
+            # Get embeddings
+            print(f"Fetching embeddings for {len(chat_titles)} titles...")
+            report_progress("embed", month=month)
+            embeddings = get_embeddings(chat_titles)
+            if embeddings is None:
+                print("Embeddings retrieval failed.")
+                return None
+            print("Embeddings retrieved successfully.")
 
         embeddings_array = np.array(embeddings)
 
         # Perform UMAP
         print("Performing UMAP...")
-        reducer = umap.UMAP(n_neighbors=15, min_dist=0.1, random_state=42)
-        embeddings_2d = reducer.fit_transform(embeddings_array)
-
-        # Calculate distances using scipy
-        distances = pdist(embeddings_array, metric='cosine')
-        distance_matrix = squareform(distances)
-
-        clusters = perform_clustering(distance_matrix, len(chat_titles))
-
-        # Generate topics and metadata
-        cluster_metadata = generate_cluster_metadata(
-            clusters, chat_titles, distance_matrix)
-
-        return {
+        report_progress("umap", month=month)
+        layout_stats = None
+        with timed_stage("umap", items=len(chat_titles)):
+            if layout_reducer is not None:
+                embeddings_2d, layout_stats = layout_reducer.fit_transform(
+                    chat_titles, embeddings_array
+                )
+                print(f"UMAP layout for {month}: {layout_stats}")
+            else:
+                reducer = umap.UMAP(n_neighbors=15, min_dist=0.1, random_state=42)
+                embeddings_2d = reducer.fit_transform(embeddings_array)
+
+        report_progress("cluster", month=month)
+        if len(chat_titles) >= SPARSE_CLUSTERING_MIN_POINTS:
+            # Large exports: cluster on a kNN graph, never building the n x n matrix
+            print(f"Clustering {len(chat_titles)} points on a sparse kNN graph...")
+            with timed_stage("sparse_clustering", items=len(chat_titles)):
+                clusters, coherence_scores = perform_sparse_clustering(embeddings_array)
+            cluster_stats = compute_cluster_stats(embeddings_array, clusters)
+            cluster_metadata = generate_cluster_metadata(
+                clusters, chat_titles, None,
+                coherence_scores=coherence_scores, cluster_stats=cluster_stats)
+        else:
+            if distance_matrix is None:
+                # Calculate distances using scipy
+                with timed_stage("pdist", items=len(chat_titles)):
+                    distances = pdist(embeddings_array, metric='cosine')
+                    distance_matrix = squareform(distances)
+
+            clusters = perform_clustering(distance_matrix, len(chat_titles))
+
+            # Generate topics and metadata; for cosine distances the coherence
+            # from the cluster sum vectors equals the pairwise mean
+            cluster_stats = compute_cluster_stats(embeddings_array, clusters)
+            cluster_metadata = generate_cluster_metadata(
+                clusters, chat_titles, distance_matrix,
+                coherence_scores={k: v["coherence"] for k, v in cluster_stats.items()},
+                cluster_stats=cluster_stats)
+
+        update = {
             'month_year': month,
             'points': embeddings_2d.tolist(),
             'clusters': clusters.tolist(),
@@ -362,85 +523,10 @@ def process_single_month(chat_titles, month):
             'topics': cluster_metadata,
             'total_conversations': len(chat_titles)
         }
+        if layout_stats:
+            update['layout'] = layout_stats
+        return update
 
     except Exception as e:
         print(f"Error processing single month: {str(e)}")
         return None
-def analyze_branches(messages):
-    """
-    Enhanced branch detection that specifically looks for edited message branches
-    """
-    chats_with_branches = {}
-
-    # First pass: Group messages and build relationships
-    for msg in messages:
-        chat_name = msg.get("chat_name")
-        if not chat_name:
-            continue
-
-        if chat_name not in chats_with_branches:
-            chats_with_branches[chat_name] = {
-                "messages": [],
-                "message_ids": set(),
-                "parent_children": defaultdict(list),
-                "edit_branches": [],  # New: Track specifically edited message branches
-            }
-
-        chat_data = chats_with_branches[chat_name]
-        msg_id = msg.get("message_id")
-        parent_id = msg.get("parent_message_id")
-        timestamp = pd.to_datetime(msg.get("timestamp"))
-
-        # Store message with additional metadata
-        msg_data = {
-            **msg,
-            "timestamp_obj": timestamp,
-            "children": [],
-            "is_branch_point": False,
-        }
-
-        chat_data["messages"].append(msg_data)
-
-        if msg_id:
-            chat_data["message_ids"].add(msg_id)
-            if parent_id:
-                chat_data["parent_children"][parent_id].append(msg_data)
-
-    # Second pass: Identify edit branches
-    for chat_name, chat_data in chats_with_branches.items():
-        for parent_id, children in chat_data["parent_children"].items():
-            if len(children) > 1:
-                # Sort children by timestamp
-                children.sort(key=lambda x: x["timestamp_obj"])
-
-                # Check for potential edit branches
-                time_gaps = []
-                for i in range(1, len(children)):
-                    time_diff = (
-                        children[i]["timestamp_obj"] - children[i - 1]["timestamp_obj"]
-                    ).total_seconds()
-                    time_gaps.append(time_diff)
-
-                # If there are significant time gaps between children, likely edit branches
-                for i, gap in enumerate(time_gaps):
-                    if gap > 60:  # More than 1 minute gap suggests an edit
-                        branch_data = {
-                            "parent_message": parent_id,
-                            "original_branch": children[i],
-                            "edit_branch": children[i + 1],
-                            "time_gap": gap,
-                            "branch_messages": [],
-                        }
-
-                        # Collect all subsequent messages in this branch
-                        def collect_branch_messages(msg):
-                            branch_data["branch_messages"].append(msg)
-                            msg_id = msg.get("message_id")
-                            if msg_id in chat_data["parent_children"]:
-                                for child in chat_data["parent_children"][msg_id]:
-                                    collect_branch_messages(child)
-
-                        collect_branch_messages(children[i + 1])
-                        chat_data["edit_branches"].append(branch_data)
-
-    return chats_with_branches
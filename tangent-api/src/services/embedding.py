@@ -1,22 +1,50 @@
-import requests
 import os
 
+import numpy as np
+
+from services.embedding_cache import get_embedding_cache
+from services.metrics import STAGE_ERRORS, timed_stage
+from services.ollama_client import OllamaError, get_client
+
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-minilm")
 
 
-def get_embeddings(texts):
+def fetch_embeddings(texts):
     """Get embeddings from the embedding API"""
-    url = "http://localhost:11434/api/embed"
-    payload = {"model": EMBEDDING_MODEL, "input": texts}
-    headers = {"Content-Type": "application/json"}
-
     try:
-        response = requests.post(url, json=payload, headers=headers)
-        if response.status_code == 200:
-            return response.json().get("embeddings", [])
-        else:
-            print(f"Error: Received status code {response.status_code}")
-            return None
+        return get_client().embed(texts, EMBEDDING_MODEL)
+    except OllamaError as e:
+        print(f"Error: {str(e)}")
+        return None
     except Exception as e:
         print(f"Error getting embeddings: {str(e)}")
         return None
+
+
+def get_embeddings(texts):
+    """Get embeddings for texts, only sending cache misses to the embedding API"""
+    if not texts:
+        return []
+
+    cache = get_embedding_cache(EMBEDDING_MODEL)
+
+    # Duplicates within a batch are looked up and fetched only once
+    unique_texts = list(dict.fromkeys(texts))
+    vectors = cache.get_many(unique_texts)
+    missing = [text for text in unique_texts if text not in vectors]
+
+    if missing:
+        print(f"Embedding cache: {len(vectors)} hits, {len(missing)} misses")
+        with timed_stage("embed", items=len(missing)) as stage:
+            fetched = fetch_embeddings(missing)
+            if fetched is None:
+                # fetch_embeddings reports failures by returning None
+                stage.items = None
+                STAGE_ERRORS.inc("embed")
+                return None
+
+        fetched = np.asarray(fetched, dtype=np.float32)
+        cache.put_many(missing, fetched)
+        vectors.update(zip(missing, fetched))
+
+    return [vectors[text].tolist() for text in texts]
@@ -0,0 +1,170 @@
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+from config import EMBEDDING_CACHE_DIR, EMBEDDING_CACHE_MEMORY_SIZE
+
+
+def text_key(text: str) -> str:
+    """Content address of a text: sha256 of its UTF-8 bytes"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Disk-backed embedding store for one model with an in-memory LRU front.
+
+    Vectors are appended to ``vectors.f32`` as raw little-endian float32 rows and
+    their text hashes to ``keys.txt`` (one per line after a ``dim=`` header). Vectors
+    are always written before keys, so a crash mid-append leaves at most some
+    unreferenced trailing rows which are truncated on the next load.
+    """
+
+    def __init__(self, model: str, cache_dir: str = EMBEDDING_CACHE_DIR,
+                 memory_size: int = EMBEDDING_CACHE_MEMORY_SIZE):
+        self.model = model
+        self.dir = os.path.join(cache_dir, re.sub(r"[^A-Za-z0-9_.-]", "_", model))
+        self.vectors_path = os.path.join(self.dir, "vectors.f32")
+        self.keys_path = os.path.join(self.dir, "keys.txt")
+        self.memory_size = memory_size
+
+        self.dim = 0
+        self.hits = 0
+        self.misses = 0
+        self._rows: Dict[str, int] = {}
+        self._lru: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._mmap = None
+        self._lock = threading.Lock()
+
+        os.makedirs(self.dir, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.keys_path):
+            return
+
+        with open(self.keys_path, "r") as f:
+            keys = [line.strip() for line in f if line.strip()]
+        if not keys:
+            return
+
+        # The first line of keys.txt records the vector dimension
+        header, keys = keys[0], keys[1:]
+        self.dim = int(header.split("=", 1)[1])
+
+        vector_bytes = os.path.getsize(self.vectors_path) if os.path.exists(self.vectors_path) else 0
+        stored_rows = vector_bytes // (self.dim * 4)
+        if stored_rows < len(keys):
+            print(f"Embedding cache for {self.model} is missing vectors, truncating index")
+            keys = keys[:stored_rows]
+            self._rewrite_keys(keys)
+        if vector_bytes != len(keys) * self.dim * 4:
+            with open(self.vectors_path, "r+b") as f:
+                f.truncate(len(keys) * self.dim * 4)
+
+        self._rows = {key: row for row, key in enumerate(keys)}
+        print(f"Loaded {len(self._rows)} cached embeddings for {self.model}")
+
+    def _rewrite_keys(self, keys: List[str]):
+        tmp_path = self.keys_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(f"dim={self.dim}\n")
+            f.writelines(f"{key}\n" for key in keys)
+        os.replace(tmp_path, self.keys_path)
+
+    def _read_row(self, row: int) -> np.ndarray:
+        if self._mmap is None or self._mmap.shape[0] <= row:
+            self._mmap = np.memmap(self.vectors_path, dtype="<f4", mode="r").reshape(-1, self.dim)
+        return np.array(self._mmap[row])
+
+    def _remember(self, key: str, vector: np.ndarray):
+        self._lru[key] = vector
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.memory_size:
+            self._lru.popitem(last=False)
+
+    def get_many(self, texts: Sequence[str]) -> Dict[str, np.ndarray]:
+        """Return the cached vectors for whichever of ``texts`` are present"""
+        found = {}
+        with self._lock:
+            for text in texts:
+                key = text_key(text)
+                vector = self._lru.get(key)
+                if vector is not None:
+                    self._lru.move_to_end(key)
+                elif key in self._rows:
+                    vector = self._read_row(self._rows[key])
+                    self._remember(key, vector)
+                else:
+                    self.misses += 1
+                    continue
+                self.hits += 1
+                found[text] = vector
+        return found
+
+    def put_many(self, texts: Sequence[str], vectors) -> None:
+        """Persist freshly computed vectors for ``texts``"""
+        vectors = np.asarray(vectors, dtype="<f4")
+        if vectors.ndim != 2 or len(vectors) != len(texts):
+            raise ValueError("Expected one embedding vector per text")
+
+        with self._lock:
+            if not self.dim:
+                self.dim = vectors.shape[1]
+                self._rewrite_keys([])
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(
+                    f"Embedding dimension changed for {self.model}: {vectors.shape[1]} != {self.dim}"
+                )
+
+            new_keys, new_rows, seen = [], [], set()
+            for text, vector in zip(texts, vectors):
+                key = text_key(text)
+                if key not in self._rows and key not in seen:
+                    seen.add(key)
+                    new_keys.append(key)
+                    new_rows.append(vector)
+                self._remember(key, vector)
+
+            if not new_keys:
+                return
+
+            with open(self.vectors_path, "ab") as f:
+                f.write(np.stack(new_rows).astype("<f4").tobytes())
+            with open(self.keys_path, "a") as f:
+                f.writelines(f"{key}\n" for key in new_keys)
+
+            start = len(self._rows)
+            for offset, key in enumerate(new_keys):
+                self._rows[key] = start + offset
+
+    def stats(self) -> dict:
+        return {
+            "model": self.model,
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self._rows),
+            "memory_entries": len(self._lru),
+            "dimension": self.dim,
+        }
+
+
+_caches: Dict[str, EmbeddingCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_embedding_cache(model: str) -> EmbeddingCache:
+    """Return the process-wide cache for ``model``"""
+    with _caches_lock:
+        if model not in _caches:
+            _caches[model] = EmbeddingCache(model)
+        return _caches[model]
+
+
+def get_cache_stats() -> List[dict]:
+    with _caches_lock:
+        return [cache.stats() for cache in _caches.values()]
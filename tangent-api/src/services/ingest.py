@@ -0,0 +1,172 @@
+import json
+import os
+from typing import Iterator, Tuple
+
+import pandas as pd
+
+from config import CHATGPT_DATA_DIR, CLAUDE_DATA_DIR
+
+READ_CHUNK_SIZE = 1 << 20  # 1 MiB
+
+MESSAGE_COLUMNS = [
+    "chat_name",
+    "chat_id",
+    "message_id",
+    "parent_message_id",
+    "branch_id",
+    "sender",
+    "timestamp",
+    "text",
+    "is_branch_point",
+]
+
+
+def iter_json_array(file_path: str, chunk_size: int = READ_CHUNK_SIZE) -> Iterator:
+    """Yield the elements of a top-level JSON array one at a time.
+
+    Only the current element and the unread part of the current chunk are held
+    in memory. When an element spans more than the buffered text, the read size
+    doubles so very large conversations are not re-decoded many times.
+    """
+    decoder = json.JSONDecoder()
+    with open(file_path, "r", encoding="utf-8") as f:
+        buffer = f.read(chunk_size).lstrip("\ufeff")
+        pos = len(buffer) - len(buffer.lstrip())
+        if not buffer[pos : pos + 1] == "[":
+            raise ValueError("Expected a JSON array of conversations")
+        pos += 1
+        eof = False
+        read_size = chunk_size
+
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+
+            if pos < len(buffer) and buffer[pos] == "]":
+                return
+
+            if pos < len(buffer):
+                try:
+                    element, pos = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                else:
+                    yield element
+                    read_size = chunk_size
+                    continue
+            elif eof:
+                raise ValueError("Unexpected end of file inside JSON array")
+
+            # Need more text: drop what has been consumed and read the next chunk
+            more = f.read(read_size)
+            eof = not more
+            buffer = buffer[pos:] + more
+            pos = 0
+            read_size = max(read_size, len(buffer))
+
+
+def detect_chat_type(file_path: str) -> Tuple[str, str]:
+    """
+    Detect whether the file contains Claude or ChatGPT chats and return the appropriate data directory
+
+    Only the first conversation is parsed.
+    """
+    try:
+        first_item = next(iter_json_array(file_path), {})
+
+        # ChatGPT format detection (has 'mapping' field)
+        if isinstance(first_item, dict) and "mapping" in first_item:
+            os.makedirs(CHATGPT_DATA_DIR, exist_ok=True)
+            return "chatgpt", CHATGPT_DATA_DIR
+
+        # Claude format detection (has 'chat_messages' field)
+        elif isinstance(first_item, dict) and "chat_messages" in first_item:
+            os.makedirs(CLAUDE_DATA_DIR, exist_ok=True)
+            return "claude", CLAUDE_DATA_DIR
+
+        raise ValueError("Unknown chat format")
+
+    except Exception as e:
+        raise Exception(f"Error detecting chat type: {str(e)}")
+
+
+def parse_timestamps(raw_values) -> pd.Series:
+    """Parse raw export timestamps in one vectorized pass.
+
+    Numbers (ChatGPT ``create_time``) are epoch seconds, strings (Claude
+    ``created_at``) are ISO 8601. Everything is returned as naive UTC, and
+    values that cannot be parsed become NaT.
+    """
+    values = pd.Series(raw_values, dtype=object)
+    epoch_seconds = pd.to_numeric(values, errors="coerce")
+    from_epoch = pd.to_datetime(epoch_seconds, unit="s", errors="coerce")
+    from_iso = pd.to_datetime(
+        values.where(epoch_seconds.isna()), format="ISO8601", utc=True, errors="coerce"
+    ).dt.tz_convert(None)
+    return from_epoch.fillna(from_iso)
+
+
+class MessageColumns:
+    """Append-only column buffer for parsed message records.
+
+    Timestamps are kept as the raw export values and parsed all at once when
+    the buffer becomes a DataFrame.
+    """
+
+    def __init__(self):
+        self.columns = {name: [] for name in MESSAGE_COLUMNS}
+
+    def __len__(self):
+        return len(self.columns["message_id"])
+
+    def append(self, **record):
+        for name in MESSAGE_COLUMNS:
+            self.columns[name].append(record.get(name))
+
+    def to_dataframe(self) -> pd.DataFrame:
+        df = pd.DataFrame(self.columns, columns=MESSAGE_COLUMNS)
+        df["timestamp"] = parse_timestamps(self.columns["timestamp"])
+        df = df.dropna(subset=["timestamp"])
+        return df.sort_values("timestamp", kind="stable").reset_index(drop=True)
+
+
+def load_messages(file_path: str, chat_type: str) -> pd.DataFrame:
+    """Stream an export conversation by conversation into a message DataFrame"""
+    # Imported here because data_processing itself imports this module
+    from services.data_processing import (
+        process_chatgpt_conversation,
+        process_claude_conversation,
+    )
+
+    process_conversation = (
+        process_chatgpt_conversation if chat_type == "chatgpt" else process_claude_conversation
+    )
+
+    columns = MessageColumns()
+    conversations = 0
+    for conversation in iter_json_array(file_path):
+        process_conversation(conversation, columns)
+        conversations += 1
+
+    print(f"Ingested {len(columns)} messages from {conversations} conversations")
+    return columns.to_dataframe()
+
+
+def conversation_keys(chat_ids: pd.Series, chat_names: pd.Series) -> pd.Series:
+    """Conversation of every message: its chat id, or its name when the export has none"""
+    chat_ids = chat_ids.fillna("").astype(str)
+    return chat_ids.where(chat_ids != "", chat_names.astype(str))
+
+
+def conversation_labels(chat_ids: pd.Series, chat_names: pd.Series) -> pd.Series:
+    """Display name of every message's conversation, unique per conversation.
+
+    Chats are usually labelled by name; when several conversations share a
+    name, each gets the start of its chat id appended so their branches stay
+    apart in titles and lookups.
+    """
+    keys = conversation_keys(chat_ids, chat_names)
+    names = chat_names.astype(str)
+    shared = keys.groupby(names).transform("nunique") > 1
+    return names.where(~shared, names + " [" + keys.str[:8] + "]")
@@ -0,0 +1,120 @@
+import time
+from typing import Dict, List
+
+import numpy as np
+import umap
+
+from config import UMAP_INIT_NEIGHBORS, UMAP_MODE, UMAP_WARM_MIN_EPOCHS
+
+
+def default_epochs(n_points: int) -> int:
+    """Number of epochs UMAP itself would pick for a dataset of this size"""
+    return 500 if n_points <= 10000 else 200
+
+
+def align_to_previous(coords: np.ndarray, current: np.ndarray, previous: np.ndarray) -> np.ndarray:
+    """Map ``coords`` with the similarity transform that best fits ``current`` onto ``previous``.
+
+    UMAP rescales its initial layout, so even a warm-started fit comes back in a
+    different frame; a Procrustes fit on the carried-over points undoes that.
+    """
+    current_mean = current.mean(axis=0)
+    previous_mean = previous.mean(axis=0)
+    current_centered = current - current_mean
+    previous_centered = previous - previous_mean
+
+    u, s, vt = np.linalg.svd(current_centered.T @ previous_centered)
+    rotation = u @ vt
+    norm = np.sum(current_centered**2)
+    scale = s.sum() / norm if norm > 0 else 1.0
+    return (coords - current_mean) @ rotation * scale + previous_mean
+
+
+class LayoutReducer:
+    """Month-to-month 2D layout keyed by chat title.
+
+    In ``warm`` mode each fit starts from the previous month's coordinates,
+    places new titles at the mean position of their nearest already-embedded
+    neighbours, and runs fewer epochs the smaller the share of new points.
+    ``cold`` mode fits from scratch every month like the original pipeline and
+    is kept for comparison; both modes report timing and displacement stats.
+    """
+
+    def __init__(
+        self,
+        mode: str = UMAP_MODE,
+        n_neighbors: int = 15,
+        min_dist: float = 0.1,
+        random_state: int = 42,
+    ):
+        self.mode = mode
+        self.n_neighbors = n_neighbors
+        self.min_dist = min_dist
+        self.random_state = random_state
+        self.previous: Dict[str, np.ndarray] = {}
+
+    def _initial_layout(
+        self, embeddings: np.ndarray, known: List[int], new: List[int], known_coords: np.ndarray
+    ) -> np.ndarray:
+        init = np.empty((len(embeddings), 2))
+        init[known] = known_coords
+
+        if new:
+            normalized = embeddings / np.maximum(
+                np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12
+            )
+            similarities = normalized[new] @ normalized[known].T
+            k = min(UMAP_INIT_NEIGHBORS, len(known))
+            nearest = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+            init[new] = known_coords[nearest].mean(axis=1)
+
+        return init
+
+    def fit_transform(self, chat_titles: List[str], embeddings: np.ndarray):
+        """Return the 2D layout for this month and stats about how it was produced"""
+        n_points = len(chat_titles)
+        known = [i for i, title in enumerate(chat_titles) if title in self.previous]
+        new = [i for i, title in enumerate(chat_titles) if title not in self.previous]
+        known_coords = np.array([self.previous[chat_titles[i]] for i in known])
+
+        warm = self.mode == "warm" and len(known) >= 3
+        if warm:
+            n_epochs = int(
+                UMAP_WARM_MIN_EPOCHS
+                + (default_epochs(n_points) - UMAP_WARM_MIN_EPOCHS)
+                * min(1.0, 2 * len(new) / n_points)
+            )
+            reducer = umap.UMAP(
+                n_neighbors=self.n_neighbors,
+                min_dist=self.min_dist,
+                random_state=self.random_state,
+                init=self._initial_layout(embeddings, known, new, known_coords),
+                n_epochs=n_epochs,
+            )
+        else:
+            n_epochs = default_epochs(n_points)
+            reducer = umap.UMAP(
+                n_neighbors=self.n_neighbors,
+                min_dist=self.min_dist,
+                random_state=self.random_state,
+            )
+
+        start_time = time.time()
+        embeddings_2d = reducer.fit_transform(embeddings)
+        seconds = time.time() - start_time
+
+        stats = {
+            "mode": "warm" if warm else "cold",
+            "seconds": round(seconds, 3),
+            "n_epochs": n_epochs,
+            "new_points": len(new),
+        }
+
+        if known:
+            embeddings_2d = align_to_previous(embeddings_2d, embeddings_2d[known], known_coords)
+            displacement = np.linalg.norm(embeddings_2d[known] - known_coords, axis=1)
+            stats["mean_displacement"] = round(float(displacement.mean()), 4)
+            stats["max_displacement"] = round(float(displacement.max()), 4)
+
+        self.previous = dict(zip(chat_titles, embeddings_2d))
+        return embeddings_2d, stats
@@ -0,0 +1,161 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Iterable, List, Optional
+
+from config import LLM_CACHE_MAX_BYTES, LLM_CACHE_PATH
+
+
+class LLMResponseCache:
+    """Persistent memo of LLM responses keyed by model, prompt version and inputs.
+
+    Entries live in an in-memory LRU that is bounded by the total size of the
+    cached responses. Every write is appended to a JSON-lines log which is
+    replayed on startup and compacted once it holds far more records than the
+    live entries.
+
+    A ``read_only`` cache (used in pipeline worker processes) never writes the
+    log; its new entries are collected with ``drain_unsaved`` and stored by the
+    process that owns the file.
+    """
+
+    def __init__(
+        self,
+        path: str = LLM_CACHE_PATH,
+        max_bytes: int = LLM_CACHE_MAX_BYTES,
+        read_only: bool = False,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.read_only = read_only
+        self.unsaved: List[dict] = []
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        self._bytes = 0
+        self._log_records = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._load()
+
+    @staticmethod
+    def make_key(kind: str, model: str, version: int, inputs: Iterable[str]) -> str:
+        """Cache key for a prompt; inputs are sorted so their order is irrelevant"""
+        material = json.dumps([kind, model, version, sorted(inputs)], ensure_ascii=False)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+
+        with open(self.path, "r") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A torn final line from an interrupted write
+                    continue
+                self._log_records += 1
+                self._store(record["key"], record["kind"], record["value"])
+
+        self._evict()
+        print(f"Loaded {len(self._entries)} cached LLM responses")
+
+    def _store(self, key: str, kind: str, value: str):
+        self._discard(key)
+        self._entries[key] = {"kind": kind, "value": value}
+        self._bytes += len(value.encode("utf-8"))
+
+    def _discard(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry["value"].encode("utf-8"))
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and self._entries:
+            key = next(iter(self._entries))
+            self._discard(key)
+
+    def _compact(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            for key, entry in self._entries.items():
+                f.write(json.dumps({"key": key, **entry}) + "\n")
+        os.replace(tmp_path, self.path)
+        self._log_records = len(self._entries)
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry["value"]
+
+    def put(self, key: str, kind: str, value: str):
+        with self._lock:
+            self._store(key, kind, value)
+            self._evict()
+            if self.read_only:
+                self.unsaved.append({"key": key, "kind": kind, "value": value})
+                return
+            with open(self.path, "a") as f:
+                f.write(json.dumps({"key": key, "kind": kind, "value": value}) + "\n")
+            self._log_records += 1
+            if self._log_records > 2 * len(self._entries) + 100:
+                self._compact()
+
+    def invalidate(self, kind: Optional[str] = None) -> int:
+        """Drop all entries, or only those of one kind; returns the number removed"""
+        with self._lock:
+            keys = [
+                key
+                for key, entry in self._entries.items()
+                if kind is None or entry["kind"] == kind
+            ]
+            for key in keys:
+                self._discard(key)
+            if not self.read_only:
+                self._compact()
+            return len(keys)
+
+    def drain_unsaved(self) -> List[dict]:
+        """Entries put into a read-only cache since the last call"""
+        with self._lock:
+            records, self.unsaved = self.unsaved, []
+            return records
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+_cache: Optional[LLMResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> LLMResponseCache:
+    """Return the process-wide LLM response cache"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMResponseCache()
+        return _cache
+
+
+def use_read_only_llm_cache():
+    """Make this process's cache read-only, leaving the log to the parent process"""
+    global _cache
+    with _cache_lock:
+        _cache = LLMResponseCache(read_only=True)
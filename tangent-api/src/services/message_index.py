@@ -0,0 +1,91 @@
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from services.ingest import conversation_keys, conversation_labels
+from services.message_store import latest_messages_stamp, load_latest_messages
+
+
+class MessageIndex:
+    """Processed messages of one data dir, grouped by conversation and branch.
+
+    Conversations are keyed by chat id; ``labels`` maps the display names used
+    in branch titles to those ids. Every branch list is sorted by timestamp
+    once at build time, so the /messages endpoints only do dictionary lookups.
+    """
+
+    def __init__(self, messages: List[dict], stamp: Optional[tuple] = None):
+        self.stamp = stamp
+        self.messages = messages
+        self.chats: Dict[str, Dict[str, List[dict]]] = defaultdict(dict)
+
+        chat_ids = pd.Series([msg.get("chat_id") for msg in messages], dtype=object)
+        chat_names = pd.Series([msg.get("chat_name") for msg in messages], dtype=object)
+        keys = conversation_keys(chat_ids, chat_names).tolist()
+        self.labels: Dict[str, str] = dict(
+            zip(conversation_labels(chat_ids, chat_names).tolist(), keys)
+        )
+
+        timestamps = pd.to_datetime(
+            pd.Series([msg.get("timestamp", "0") for msg in messages], dtype=object),
+            format="ISO8601",
+            utc=True,
+            errors="coerce",
+        )
+        for i in np.argsort(timestamps.dt.tz_convert(None).to_numpy(), kind="stable"):
+            msg = messages[i]
+            branches = self.chats[keys[i]]
+            branches.setdefault(msg.get("branch_id", "0"), []).append(msg)
+        self.chats = dict(self.chats)
+
+    def __len__(self):
+        return len(self.messages)
+
+    def chat_id(self, chat: str) -> str:
+        """Chat id of a conversation given by display name or id"""
+        return self.labels.get(chat, chat)
+
+    def branch(self, chat: str, branch_id: str = "0") -> List[dict]:
+        """Messages of one branch of a chat, oldest first"""
+        return self.chats.get(self.chat_id(chat), {}).get(branch_id, [])
+
+    def branches(self, chat: str) -> Dict[str, List[dict]]:
+        """All branches of a chat, each oldest first"""
+        return self.chats.get(self.chat_id(chat), {})
+
+
+_indexes: Dict[str, MessageIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_message_index(data_dir: str) -> Optional[MessageIndex]:
+    """Index for the latest processed messages of a data dir, rebuilt when they change.
+
+    Returns None when the data dir has no processed messages.
+    """
+    stamp = latest_messages_stamp(data_dir)
+    if stamp is None:
+        return None
+
+    index = _indexes.get(data_dir)
+    if index is not None and index.stamp == stamp:
+        return index
+
+    with _indexes_lock:
+        index = _indexes.get(data_dir)
+        if index is not None and index.stamp == stamp:
+            return index
+
+        start = time.time()
+        messages = load_latest_messages(data_dir) or []
+        index = MessageIndex(messages, stamp)
+        _indexes[data_dir] = index
+        print(
+            f"Indexed {len(index)} messages in {len(index.chats)} chats "
+            f"for {data_dir} in {time.time() - start:.2f}s"
+        )
+        return index
@@ -0,0 +1,133 @@
+import json
+import os
+import shutil
+import threading
+import time
+from typing import List, Optional
+
+import pandas as pd
+
+
+class MessageStore:
+    """Month-partitioned Parquet store for the parsed messages of one data dir.
+
+    Each message is written exactly once, into the partition of the month it
+    was sent in. ``manifest.json`` lists the partitions and carries a version
+    number that is bumped on every write, so readers can tell when to reload.
+    """
+
+    def __init__(self, data_dir: str):
+        self.dir = os.path.join(data_dir, "messages")
+        self.manifest_path = os.path.join(self.dir, "manifest.json")
+        self._lock = threading.Lock()
+
+    def _read_manifest(self) -> dict:
+        if not os.path.exists(self.manifest_path):
+            return {"version": 0, "partitions": []}
+        with open(self.manifest_path, "r") as f:
+            return json.load(f)
+
+    def _write_manifest(self, manifest: dict):
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def exists(self) -> bool:
+        return os.path.exists(self.manifest_path)
+
+    def version(self) -> int:
+        return self._read_manifest()["version"]
+
+    def months(self) -> List[str]:
+        return [p["month_year"] for p in self._read_manifest()["partitions"]]
+
+    def reset(self):
+        """Remove all partitions before a new processing run"""
+        with self._lock:
+            version = self._read_manifest()["version"]
+            shutil.rmtree(self.dir, ignore_errors=True)
+            os.makedirs(self.dir, exist_ok=True)
+            self._write_manifest({"version": version + 1, "partitions": []})
+
+    def write_partition(self, month_year: str, messages: pd.DataFrame):
+        """Write (or replace) the partition holding the messages of one month"""
+        with self._lock:
+            os.makedirs(self.dir, exist_ok=True)
+            file_name = f"part-{month_year}.parquet"
+            tmp_path = os.path.join(self.dir, file_name + ".tmp")
+            messages.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, os.path.join(self.dir, file_name))
+
+            manifest = self._read_manifest()
+            partitions = [p for p in manifest["partitions"] if p["month_year"] != month_year]
+            partitions.append(
+                {
+                    "month_year": month_year,
+                    "file": file_name,
+                    "rows": len(messages),
+                    "bytes": os.path.getsize(os.path.join(self.dir, file_name)),
+                    "written_at": time.time(),
+                }
+            )
+            manifest["partitions"] = sorted(partitions, key=lambda p: p["month_year"])
+            manifest["version"] += 1
+            self._write_manifest(manifest)
+
+    def read(self, as_of: Optional[str] = None, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """All messages up to and including month ``as_of`` (everything when None)"""
+        partitions = [
+            p
+            for p in self._read_manifest()["partitions"]
+            if as_of is None or p["month_year"] <= as_of
+        ]
+        if not partitions:
+            return pd.DataFrame(columns=columns)
+        return pd.concat(
+            [pd.read_parquet(os.path.join(self.dir, p["file"]), columns=columns) for p in partitions],
+            ignore_index=True,
+        )
+
+
+def messages_to_records(messages: pd.DataFrame) -> List[dict]:
+    """JSON-ready message dicts in the shape the messages_<month>.json files had"""
+    return json.loads(messages.to_json(orient="records", date_format="iso"))
+
+
+def _legacy_messages_path(data_dir: str) -> Optional[str]:
+    states_dir = os.path.join(data_dir, "states")
+    if not os.path.isdir(states_dir):
+        return None
+    message_files = [f for f in os.listdir(states_dir) if f.startswith("messages_")]
+    if not message_files:
+        return None
+    return os.path.join(states_dir, sorted(message_files)[-1])
+
+
+def latest_messages_stamp(data_dir: str) -> Optional[tuple]:
+    """Identifies the data load_latest_messages would return; changes whenever it does"""
+    store = MessageStore(data_dir)
+    if store.exists():
+        return ("store", store.version(), os.stat(store.manifest_path).st_mtime_ns)
+
+    legacy_path = _legacy_messages_path(data_dir)
+    if legacy_path is None:
+        return None
+    return ("legacy", legacy_path, os.stat(legacy_path).st_mtime_ns)
+
+
+def load_latest_messages(data_dir: str) -> Optional[List[dict]]:
+    """All processed messages for a data dir, or None when nothing was processed.
+
+    Falls back to the newest legacy cumulative messages_<month>.json snapshot for
+    data processed before the store existed.
+    """
+    store = MessageStore(data_dir)
+    if store.exists():
+        return messages_to_records(store.read())
+
+    legacy_path = _legacy_messages_path(data_dir)
+    if legacy_path is None:
+        return None
+    with open(legacy_path, "r") as f:
+        return json.load(f)
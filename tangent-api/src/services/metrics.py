@@ -0,0 +1,237 @@
+"""Process-wide counters and histograms, rendered in the Prometheus text format.
+
+Pipeline stages are timed with ``timed_stage`` and calls to external services
+(Ollama) are recorded with ``record_call``; /api/metrics serves ``render_metrics()``.
+"""
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional, Sequence, Tuple
+
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0,
+)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in zip(names, values)
+    ]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    """Monotonic count per label set"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            yield f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}"
+
+
+class Histogram:
+    """Observation counts per bucket, with their sum and count, per label set"""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = DURATION_BUCKETS,
+    ):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [non-cumulative bucket counts (+Inf last), sum, count]
+        self._values: Dict[LabelValues, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def samples(self):
+        with self._lock:
+            values = {labels: (list(e[0]), e[1], e[2]) for labels, e in self._values.items()}
+        for labels, (counts, total, count) in sorted(values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                le = 'le="{}"'.format(_format_value(bound))
+                yield f"{self.name}_bucket{_format_labels(self.label_names, labels, le)} {cumulative}"
+            label_text = _format_labels(self.label_names, labels)
+            yield f"{self.name}_sum{label_text} {_format_value(total)}"
+            yield f"{self.name}_count{label_text} {count}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            return metric
+
+    def counter(self, name: str, help_text: str, label_names: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, help_text, label_names)
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = DURATION_BUCKETS,
+    ) -> Histogram:
+        return self._get_or_create(Histogram, name, help_text, label_names, buckets)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.histogram(
+    "tangent_stage_duration_seconds", "Duration of pipeline stages", ["stage"]
+)
+STAGE_ITEMS = registry.counter(
+    "tangent_stage_items_total", "Items handled by pipeline stages", ["stage"]
+)
+STAGE_ERRORS = registry.counter(
+    "tangent_stage_errors_total", "Pipeline stage runs that raised", ["stage"]
+)
+TASKS = registry.counter(
+    "tangent_tasks_total", "Processing tasks by final status", ["status"]
+)
+EXTERNAL_SECONDS = registry.histogram(
+    "tangent_external_call_duration_seconds",
+    "Duration of calls to external services, per attempt",
+    ["service", "operation"],
+)
+EXTERNAL_ERRORS = registry.counter(
+    "tangent_external_call_errors_total",
+    "Failed calls to external services, per attempt",
+    ["service", "operation"],
+)
+
+
+# Set in pipeline worker processes by capture_observations: stage and call
+# observations are also kept here, so the parent can record them with
+# replay_observations
+_observations: Optional[list] = None
+
+
+def capture_observations():
+    """Keep this process's observations for drain_observations as well"""
+    global _observations
+    _observations = []
+
+
+def drain_observations() -> list:
+    """Observations captured since the last call, as picklable tuples"""
+    global _observations
+    if _observations is None:
+        return []
+    observations, _observations = _observations, []
+    return observations
+
+
+def replay_observations(observations: list):
+    """Record observations captured in another process"""
+    for kind, *values in observations:
+        if kind == "stage":
+            record_stage(*values)
+        else:
+            record_call(*values)
+
+
+def record_stage(stage: str, seconds: float, items: Optional[int] = None, failed: bool = False):
+    """Record one run of a pipeline stage"""
+    if failed:
+        STAGE_ERRORS.inc(stage)
+    STAGE_SECONDS.observe(seconds, stage)
+    if items:
+        STAGE_ITEMS.inc(stage, amount=items)
+    if _observations is not None:
+        _observations.append(("stage", stage, seconds, items, failed))
+
+
+class StageTimer:
+    """Handle of a running timed_stage; set ``items`` once the count is known"""
+
+    def __init__(self, items: Optional[int] = None):
+        self.items = items
+
+
+@contextmanager
+def timed_stage(stage: str, items: Optional[int] = None):
+    """Record the duration, item count and failure of a pipeline stage"""
+    timer = StageTimer(items)
+    start = time.perf_counter()
+    failed = False
+    try:
+        yield timer
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        record_stage(stage, time.perf_counter() - start, timer.items, failed)
+
+
+def record_call(service: str, operation: str, seconds: float, failed: bool = False):
+    """Record one call (or retry attempt) to an external service"""
+    EXTERNAL_SECONDS.observe(seconds, service, operation)
+    if failed:
+        EXTERNAL_ERRORS.inc(service, operation)
+    if _observations is not None:
+        _observations.append(("call", service, operation, seconds, failed))
+
+
+def render_metrics() -> str:
+    return registry.render()
@@ -0,0 +1,165 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from services.metrics import record_call
+from services.progress import report_progress
+
+from config import (
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_CONCURRENCY,
+    OLLAMA_MAX_RETRIES,
+    OLLAMA_POOL_SIZE,
+    OLLAMA_RETRY_BACKOFF,
+    OLLAMA_TIMEOUT,
+    OLLAMA_URL,
+)
+
+
+class OllamaError(Exception):
+    """Raised when an Ollama request still fails after all retries"""
+
+
+class OllamaTimeout(OllamaError):
+    """Raised when the last attempt of an Ollama request timed out"""
+
+
+class OllamaClient:
+    """Thin Ollama HTTP client sharing one keep-alive connection pool.
+
+    Embedding inputs are split into batches that run on a bounded thread pool;
+    failed requests are retried with exponential backoff.
+    """
+
+    def __init__(
+        self,
+        base_url: str = OLLAMA_URL,
+        timeout: float = OLLAMA_TIMEOUT,
+        max_retries: int = OLLAMA_MAX_RETRIES,
+        backoff: float = OLLAMA_RETRY_BACKOFF,
+        pool_size: int = OLLAMA_POOL_SIZE,
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+        concurrency: int = EMBEDDING_CONCURRENCY,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.batch_size = max(1, batch_size)
+        self.concurrency = max(1, concurrency)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"Content-Type": "application/json"})
+
+    def _post(
+        self,
+        path: str,
+        payload: dict,
+        timeout: Optional[float] = None,
+        max_retries: Optional[int] = None,
+    ) -> dict:
+        url = f"{self.base_url}{path}"
+        last_error = None
+        timed_out = False
+        if max_retries is None:
+            max_retries = self.max_retries
+
+        for attempt in range(max_retries + 1):
+            if attempt:
+                delay = self.backoff * (2 ** (attempt - 1))
+                print(f"Retrying {path} in {delay:.1f}s (attempt {attempt + 1}): {last_error}")
+                time.sleep(delay)
+
+            start = time.perf_counter()
+            try:
+                response = self.session.post(
+                    url, json=payload, timeout=timeout or self.timeout
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                record_call("ollama", path, time.perf_counter() - start, failed=True)
+                last_error = str(e)
+                timed_out = isinstance(e, requests.Timeout)
+                continue
+
+            record_call(
+                "ollama", path, time.perf_counter() - start, failed=response.status_code != 200
+            )
+            if response.status_code == 200:
+                return response.json()
+
+            last_error = f"Received status code {response.status_code}"
+            timed_out = False
+            # Client errors other than rate limiting will not succeed on retry
+            if response.status_code < 500 and response.status_code != 429:
+                break
+
+        error_class = OllamaTimeout if timed_out else OllamaError
+        raise error_class(f"Request to {path} failed: {last_error}")
+
+    def _embed_batch(self, model: str, texts: List[str]) -> List[List[float]]:
+        embeddings = self._post("/api/embed", {"model": model, "input": texts}).get(
+            "embeddings", []
+        )
+        if len(embeddings) != len(texts):
+            raise OllamaError(
+                f"Expected {len(texts)} embeddings, received {len(embeddings)}"
+            )
+        return embeddings
+
+    def embed(self, texts: List[str], model: str) -> List[List[float]]:
+        """Embed texts in batches, returning vectors in input order"""
+        batches = [
+            texts[i : i + self.batch_size] for i in range(0, len(texts), self.batch_size)
+        ]
+        vectors = []
+        if len(batches) <= 1 or self.concurrency == 1:
+            for i, batch in enumerate(batches):
+                vectors.extend(self._embed_batch(model, batch))
+                report_progress("embed", done=i + 1, total=len(batches))
+            return vectors
+
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(batches))) as pool:
+            # map() yields results in submission order, whatever order they finish in
+            results = pool.map(lambda batch: self._embed_batch(model, batch), batches)
+            for i, batch in enumerate(results):
+                vectors.extend(batch)
+                report_progress("embed", done=i + 1, total=len(batches))
+            return vectors
+
+    def generate(
+        self,
+        prompt: str,
+        model: str,
+        options: Optional[dict] = None,
+        timeout: Optional[float] = None,
+        max_retries: Optional[int] = None,
+    ) -> str:
+        """Run a non-streaming completion and return the response text"""
+        payload = {"model": model, "prompt": prompt, "stream": False}
+        if options:
+            payload["options"] = options
+        return self._post(
+            "/api/generate", payload, timeout=timeout, max_retries=max_retries
+        ).get(
+            "response", ""
+        ).strip()
+
+
+_client: Optional[OllamaClient] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> OllamaClient:
+    """Return the process-wide Ollama client"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = OllamaClient()
+        return _client
@@ -0,0 +1,145 @@
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from config import TOPIC_CONCURRENCY
+from services.llm_cache import get_llm_cache
+from services.metrics import replay_observations
+
+# Set in each worker process by _init_worker
+_worker = {}
+
+
+def _init_worker(
+    shm_name: str,
+    shape: tuple,
+    dtype: str,
+    chat_titles: List[str],
+    topic_slots,
+    topic_concurrency: int,
+):
+    """Attach the parent's embedding block once per worker, without copying it.
+
+    Topic LLM calls share the parent's TOPIC_CONCURRENCY slots, and LLM
+    responses are returned to the parent instead of written to the cache log.
+    """
+    from services.clustering import share_topic_slots
+    from services.llm_cache import use_read_only_llm_cache
+    from services.metrics import capture_observations
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    _worker["shm"] = shm
+    _worker["embeddings"] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+    _worker["chat_titles"] = chat_titles
+    share_topic_slots(topic_slots, topic_concurrency)
+    use_read_only_llm_cache()
+    capture_observations()
+
+
+def _process_month(month: str, n_titles: int) -> tuple:
+    """``(update, error, llm_records, observations)`` of one month.
+
+    New LLM responses and the metrics observed while fitting the month are
+    returned with it, also when it fails, for the parent to record.
+    """
+    # Imported here because data_processing itself imports this module
+    from services.data_processing import process_single_month
+    from services.llm_cache import get_llm_cache
+    from services.metrics import drain_observations
+
+    try:
+        update, error = (
+            process_single_month(
+                _worker["chat_titles"][:n_titles],
+                month,
+                embeddings=_worker["embeddings"][:n_titles],
+            ),
+            None,
+        )
+    except Exception as e:
+        update, error = None, str(e)
+    if update is None and error is None:
+        # Distinct from the passthrough months, which the caller fills in
+        error = "month produced no update"
+    return update, error, get_llm_cache().drain_unsaved(), drain_observations()
+
+
+def process_months_in_pool(
+    chat_titles: List[str],
+    embeddings: np.ndarray,
+    plan: List[Tuple[str, Optional[int]]],
+    workers: int,
+) -> Iterator[Tuple[str, Optional[dict], Optional[str]]]:
+    """Run process_single_month for planned months in a process pool, in month order.
+
+    ``plan`` lists ``(month, n_titles)`` in month order; a month is fitted on
+    the first ``n_titles`` titles and embedding rows, and ``n_titles=None``
+    marks a month that is passed through for the caller to fill in. The
+    embeddings live in one shared memory block every worker maps read-only.
+    At most two jobs per worker are in flight, and each yields
+    ``(month, update, error)`` as soon as every earlier month is done.
+    Topic labelling in all workers together stays within TOPIC_CONCURRENCY
+    LLM calls; the labels they generate are stored in this process's LLM
+    cache and their stage and call timings recorded in its metrics.
+    """
+    embeddings = np.ascontiguousarray(embeddings)
+    shm = shared_memory.SharedMemory(create=True, size=max(embeddings.nbytes, 1))
+    np.ndarray(embeddings.shape, dtype=embeddings.dtype, buffer=shm.buf)[:] = embeddings
+
+    # Spawned workers do not inherit the server's threads, locks or sockets
+    context = multiprocessing.get_context("spawn")
+    pool = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=context,
+        initializer=_init_worker,
+        initargs=(
+            shm.name,
+            embeddings.shape,
+            embeddings.dtype.str,
+            chat_titles,
+            context.BoundedSemaphore(TOPIC_CONCURRENCY),
+            -(-TOPIC_CONCURRENCY // workers),
+        ),
+    )
+    llm_cache = get_llm_cache()
+    try:
+        queue = deque()
+        remaining = iter(plan)
+        in_flight = 0
+        while True:
+            while in_flight < 2 * workers:
+                item = next(remaining, None)
+                if item is None:
+                    break
+                month, n_titles = item
+                if n_titles is None:
+                    queue.append((month, None))
+                else:
+                    queue.append((month, pool.submit(_process_month, month, n_titles)))
+                    in_flight += 1
+
+            if not queue:
+                break
+            month, future = queue.popleft()
+            if future is None:
+                yield month, None, None
+                continue
+
+            in_flight -= 1
+            try:
+                update, error, llm_records, observations = future.result()
+            except Exception as e:
+                update, error, llm_records, observations = None, str(e), [], []
+            for record in llm_records:
+                llm_cache.put(record["key"], record["kind"], record["value"])
+            replay_observations(observations)
+            yield month, update, error
+    finally:
+        # Also reached when the consumer stops early: drop queued months
+        pool.shutdown(wait=True, cancel_futures=True)
+        shm.close()
+        shm.unlink()
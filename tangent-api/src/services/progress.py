@@ -0,0 +1,154 @@
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+# Stages of one month, in the order process_single_month runs them
+MONTH_STAGES = ("embed", "umap", "cluster", "topics", "save")
+
+# Stages run once after the last month; together they fill one more
+# month-sized window at the end, and reports made inside them (such as
+# embedding batches) count towards the current one
+FINAL_STAGES = ("branches", "message_index")
+
+TERMINAL_EVENTS = ("complete", "error")
+
+
+class ProgressBus:
+    """In-process fan-out of task progress events to stream subscribers.
+
+    The last event of every task is kept, so a subscriber that connects
+    mid-run (or after the end) starts from the current state.
+    """
+
+    def __init__(self):
+        self._subscribers: Dict[str, List[queue.Queue]] = {}
+        self._last: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def publish(self, task_id: str, event: dict):
+        with self._lock:
+            self._last[task_id] = event
+            for subscriber in self._subscribers.get(task_id, []):
+                subscriber.put(event)
+
+    def subscribe(self, task_id: str) -> queue.Queue:
+        subscriber = queue.Queue()
+        with self._lock:
+            if task_id in self._last:
+                subscriber.put(self._last[task_id])
+            self._subscribers.setdefault(task_id, []).append(subscriber)
+        return subscriber
+
+    def unsubscribe(self, task_id: str, subscriber: queue.Queue):
+        with self._lock:
+            subscribers = self._subscribers.get(task_id, [])
+            if subscriber in subscribers:
+                subscribers.remove(subscriber)
+            if not subscribers:
+                self._subscribers.pop(task_id, None)
+
+
+class TaskProgress:
+    """Stage-level progress of one task, with elapsed time and ETA.
+
+    Overall progress counts finished months plus the share of MONTH_STAGES
+    done in the current one, followed by a last window for FINAL_STAGES; the
+    ETA extrapolates the rate since tracking started, so a resumed run is not
+    credited with earlier months.
+    """
+
+    def __init__(self, task_id: str, bus: "ProgressBus"):
+        self.task_id = task_id
+        self.bus = bus
+        self.months: Dict[str, int] = {}
+        self.month: Optional[str] = None
+        self.final_stage: Optional[str] = None
+        self.started = time.time()
+        self.start_progress: Optional[float] = None
+
+    def set_months(self, months: List[str], done: int = 0):
+        """Months the run covers, the first ``done`` of which are already finished"""
+        self.months = {month: i for i, month in enumerate(sorted(months))}
+        self.start_progress = 100 * done / (len(months) + 1)
+
+    def _overall(self, stage: str, fraction: float) -> float:
+        windows = len(self.months) + 1
+        if stage in FINAL_STAGES:
+            self.final_stage = stage
+            self.month = None
+        if self.final_stage is not None:
+            within = (FINAL_STAGES.index(self.final_stage) + fraction) / len(FINAL_STAGES)
+            return 100 * (len(self.months) + within) / windows
+        if self.month not in self.months:
+            return self.start_progress or 0.0
+        within = MONTH_STAGES.index(stage) if stage in MONTH_STAGES else 0
+        within = (within + fraction) / len(MONTH_STAGES)
+        return 100 * (self.months[self.month] + within) / windows
+
+    def report(
+        self,
+        stage: str,
+        month: Optional[str] = None,
+        done: Optional[int] = None,
+        total: Optional[int] = None,
+    ):
+        if month is not None:
+            self.month = month
+        progress = self._overall(stage, done / total if total else 0.0)
+        elapsed = time.time() - self.started
+        gained = progress - (self.start_progress or 0.0)
+        eta = elapsed * (100 - progress) / gained if gained > 0 else None
+        self.bus.publish(
+            self.task_id,
+            {
+                "type": "progress",
+                "step": stage,
+                "progress": round(progress, 1),
+                "month": self.month,
+                "done": done,
+                "total": total,
+                "elapsed": round(elapsed, 1),
+                "eta": round(eta, 1) if eta is not None else None,
+            },
+        )
+
+
+_current: ContextVar[Optional[TaskProgress]] = ContextVar("task_progress", default=None)
+
+
+@contextmanager
+def track_progress(tracker: TaskProgress):
+    """Send report_progress calls made in this context to ``tracker``"""
+    token = _current.set(tracker)
+    try:
+        yield tracker
+    finally:
+        _current.reset(token)
+
+
+def report_progress(
+    stage: str,
+    month: Optional[str] = None,
+    done: Optional[int] = None,
+    total: Optional[int] = None,
+):
+    """Report a pipeline stage for the task being processed; a no-op outside of one"""
+    tracker = _current.get()
+    if tracker is not None:
+        tracker.report(stage, month=month, done=done, total=total)
+
+
+_bus: Optional[ProgressBus] = None
+_bus_lock = threading.Lock()
+
+
+def get_progress_bus() -> ProgressBus:
+    """Return the process-wide progress bus"""
+    global _bus
+    with _bus_lock:
+        if _bus is None:
+            _bus = ProgressBus()
+        return _bus
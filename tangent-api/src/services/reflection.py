@@ -1,15 +1,28 @@
-import requests
 import os
 
+from services.llm_cache import get_llm_cache
+from services.ollama_client import OllamaError, get_client
+
 GENERATION_MODEL = os.getenv("GENERATION_MODEL", "qwen2.5-coder:7b")
 
+# Bump whenever the prompt below changes so cached reflections are not reused
+REFLECTION_PROMPT_VERSION = 1
+
 
 def generate_reflection_for_cluster(struggle_texts):
     """Generate a reflection for a cluster based on struggle texts"""
     if not struggle_texts:
         return ""
 
-    texts = "\n".join(f"- {text}" for text in struggle_texts)
+    cache = get_llm_cache()
+    cache_key = cache.make_key(
+        "reflection", GENERATION_MODEL, REFLECTION_PROMPT_VERSION, struggle_texts
+    )
+    cached_reflection = cache.get(cache_key)
+    if cached_reflection is not None:
+        return cached_reflection
+
+    texts = "\n".join(f"- {text}" for text in sorted(struggle_texts))
     prompt = f"""You are a helpful assistant. Review the following user messages where they express difficulties:
 
 {texts}
@@ -18,26 +31,17 @@ Summarize the key challenges they faced and provide a reflection or guidance tha
 
 Provide ONLY the reflection."""
 
-    payload = {
-        "model": GENERATION_MODEL,
-        "prompt": prompt,
-        "stream": False,
-        "options": {"temperature": 0.5},
-    }
-
     try:
-        response = requests.post(
-            "http://localhost:11434/api/generate",
-            json=payload,
-            headers={"Content-Type": "application/json"},
+        reflection = get_client().generate(
+            prompt, GENERATION_MODEL, options={"temperature": 0.5}
         )
-
-        if response.status_code == 200:
-            reflection = response.json().get("response", "").strip()
-            return reflection if reflection else "No reflection generated"
-        else:
-            print(f"Error: Received status code {response.status_code}")
-            return "Error generating reflection"
+        if not reflection:
+            return "No reflection generated"
+        cache.put(cache_key, "reflection", reflection)
+        return reflection
+    except OllamaError as e:
+        print(f"Error: {str(e)}")
+        return "Error generating reflection"
     except Exception as e:
         print(f"Error generating reflection: {str(e)}")
         return "Error"
@@ -0,0 +1,121 @@
+import json
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+REFLECTIONS_FILE = "reflections.json"
+REFLECTION_INDEX_FILE = "reflection_index.npz"
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+
+
+class ReflectionIndex:
+    """Cluster reflections with their embeddings as one normalised float32 matrix"""
+
+    def __init__(self, cluster_ids: List[str], reflections: List[str], vectors: np.ndarray, stamp=None):
+        self.cluster_ids = list(cluster_ids)
+        self.reflections = list(reflections)
+        self.vectors = normalize_rows(vectors)
+        self.stamp = stamp
+
+    def __len__(self):
+        return len(self.reflections)
+
+    @classmethod
+    def from_reflections(cls, reflections_data: Dict[str, dict], stamp=None) -> "ReflectionIndex":
+        """Build from the reflections.json layout: {cluster_id: {reflection, embedding}}"""
+        items = [(str(k), v) for k, v in reflections_data.items() if v.get("embedding")]
+        if not items:
+            return cls([], [], np.zeros((0, 0)), stamp)
+        return cls(
+            [cluster_id for cluster_id, _ in items],
+            [data["reflection"] for _, data in items],
+            np.array([data["embedding"] for _, data in items], dtype=np.float32),
+            stamp,
+        )
+
+    def save(self, path: str):
+        tmp_path = path + ".tmp.npz"
+        np.savez(
+            tmp_path,
+            cluster_ids=np.array(self.cluster_ids, dtype=str),
+            reflections=np.array(self.reflections, dtype=str),
+            vectors=self.vectors,
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, stamp=None) -> "ReflectionIndex":
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                data["cluster_ids"].tolist(),
+                data["reflections"].tolist(),
+                data["vectors"],
+                stamp,
+            )
+
+    def top_k(self, query, k: int = 3, min_similarity: float = 0.5) -> List[Tuple[float, str]]:
+        """The k most similar reflections above min_similarity, best first"""
+        if not len(self) or k <= 0:
+            return []
+        similarities = self.vectors @ normalize_rows(np.ravel(query))
+        if len(similarities) > k:
+            candidates = np.argpartition(-similarities, k - 1)[:k]
+        else:
+            candidates = np.arange(len(similarities))
+        candidates = candidates[np.argsort(-similarities[candidates], kind="stable")]
+        return [
+            (float(similarities[i]), self.reflections[i])
+            for i in candidates
+            if similarities[i] > min_similarity
+        ]
+
+
+def _mtime_ns(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+_indexes: Dict[str, ReflectionIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_reflection_index(data_dir: str) -> Optional[ReflectionIndex]:
+    """In-memory reflection index for a data dir, reloaded when reflections.json changes.
+
+    The normalised matrix is stored next to reflections.json, so only the first
+    load after the reflections change has to parse the JSON.
+    """
+    json_path = os.path.join(data_dir, REFLECTIONS_FILE)
+    stamp = _mtime_ns(json_path)
+    if stamp is None:
+        return None
+
+    index = _indexes.get(data_dir)
+    if index is not None and index.stamp == stamp:
+        return index
+
+    with _indexes_lock:
+        index = _indexes.get(data_dir)
+        if index is not None and index.stamp == stamp:
+            return index
+
+        index_path = os.path.join(data_dir, REFLECTION_INDEX_FILE)
+        index_mtime = _mtime_ns(index_path)
+        if index_mtime is not None and index_mtime >= stamp:
+            index = ReflectionIndex.load(index_path, stamp)
+        else:
+            with open(json_path, "r") as f:
+                index = ReflectionIndex.from_reflections(json.load(f), stamp)
+            index.save(index_path)
+            print(f"Built reflection index with {len(index)} reflections for {data_dir}")
+
+        _indexes[data_dir] = index
+        return index
@@ -0,0 +1,159 @@
+import hdbscan
+import numpy as np
+from scipy.sparse import coo_matrix, csgraph, csr_matrix
+
+from config import KNN_BLOCK_SIZE, KNN_NEIGHBORS
+
+# Sparse matrices drop explicit zeros, which HDBSCAN would read as "no edge"
+MIN_DISTANCE = 1e-8
+
+
+def normalize_embeddings(embeddings) -> np.ndarray:
+    """Return float32 embeddings scaled to unit length"""
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.maximum(norms, 1e-12)
+
+
+def knn_graph(normalized, k=KNN_NEIGHBORS, block_size=KNN_BLOCK_SIZE) -> csr_matrix:
+    """Exact cosine kNN graph computed block by block.
+
+    Only a ``block_size x n`` similarity block is alive at any time, so memory
+    stays at O(n * (block_size + k)) instead of O(n^2). The result is a
+    symmetric CSR matrix of cosine distances.
+    """
+    n_points = len(normalized)
+    k = min(k, n_points - 1)
+    rows, cols, distances = [], [], []
+
+    for start in range(0, n_points, block_size):
+        block = normalized[start : start + block_size]
+        similarities = block @ normalized.T
+        block_index = np.arange(len(block))
+        similarities[block_index, start + block_index] = -np.inf  # exclude self
+
+        nearest = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+        nearest_similarities = np.take_along_axis(similarities, nearest, axis=1)
+
+        rows.append(np.repeat(start + block_index, k))
+        cols.append(nearest.ravel())
+        distances.append(np.maximum(1.0 - nearest_similarities.ravel(), MIN_DISTANCE))
+
+    graph = coo_matrix(
+        (np.concatenate(distances), (np.concatenate(rows), np.concatenate(cols))),
+        shape=(n_points, n_points),
+    ).tocsr()
+    return connect_components(normalized, graph.maximum(graph.T))
+
+
+def connect_components(normalized, graph: csr_matrix) -> csr_matrix:
+    """Link disconnected pieces of the kNN graph, which HDBSCAN cannot handle.
+
+    Each extra component is joined to the main one by its closest pair found
+    from the component's first member.
+    """
+    n_components, labels = csgraph.connected_components(graph, directed=False)
+    if n_components == 1:
+        return graph
+
+    graph = graph.tolil()
+    main = labels == 0
+    main_indices = np.where(main)[0]
+    for component in range(1, n_components):
+        anchor = np.where(labels == component)[0][0]
+        similarities = normalized[main_indices] @ normalized[anchor]
+        target = main_indices[np.argmax(similarities)]
+        distance = max(1.0 - float(similarities.max()), MIN_DISTANCE)
+        graph[anchor, target] = distance
+        graph[target, anchor] = distance
+    return graph.tocsr()
+
+
+def perform_sparse_clustering(embeddings):
+    """Cluster embeddings with HDBSCAN on a kNN graph instead of a dense matrix.
+
+    Returns the cluster labels (outliers reassigned) and a coherence score per
+    cluster, both derived from the same graph.
+    """
+    try:
+        normalized = normalize_embeddings(embeddings)
+        graph = knn_graph(normalized)
+
+        clusterer = hdbscan.HDBSCAN(
+            min_cluster_size=2,
+            min_samples=1,
+            metric="precomputed",
+            cluster_selection_epsilon=0.3,
+            cluster_selection_method="leaf",
+            prediction_data=False,
+        )
+        clusters = clusterer.fit_predict(graph)
+
+        if np.any(clusters == -1):
+            clusters = handle_sparse_outliers(clusters, graph, normalized)
+
+        return clusters, graph_coherence(clusters, graph)
+
+    except Exception as e:
+        raise Exception(f"Sparse clustering failed: {str(e)}")
+
+
+def handle_sparse_outliers(clusters, graph: csr_matrix, normalized):
+    """Assign each outlier to the cluster with the lowest mean distance among its graph neighbours.
+
+    Outliers with no clustered neighbour fall back to the most similar cluster centroid.
+    """
+    clusters = clusters.copy()
+    valid_clusters = np.unique(clusters[clusters != -1])
+    outlier_indices = np.where(clusters == -1)[0]
+
+    if len(valid_clusters) == 0:
+        # Nothing to join: every point becomes a cluster of its own
+        clusters[outlier_indices] = np.arange(len(outlier_indices))
+        return clusters
+
+    unresolved = []
+    for idx in outlier_indices:
+        start, end = graph.indptr[idx], graph.indptr[idx + 1]
+        neighbours = graph.indices[start:end]
+        neighbour_clusters = clusters[neighbours]
+        clustered = neighbour_clusters != -1
+        if not np.any(clustered):
+            unresolved.append(idx)
+            continue
+
+        labels, inverse = np.unique(neighbour_clusters[clustered], return_inverse=True)
+        mean_distances = np.bincount(
+            inverse, weights=graph.data[start:end][clustered]
+        ) / np.bincount(inverse)
+        clusters[idx] = labels[np.argmin(mean_distances)]
+
+    if unresolved:
+        centroids = np.stack(
+            [normalized[clusters == cluster].mean(axis=0) for cluster in valid_clusters]
+        )
+        nearest = np.argmax(normalized[unresolved] @ centroids.T, axis=1)
+        clusters[unresolved] = valid_clusters[nearest]
+
+    return clusters
+
+
+def graph_coherence(clusters, graph: csr_matrix) -> dict:
+    """Mean similarity over the kNN edges inside each cluster"""
+    coo = graph.tocoo()
+    labels, inverse = np.unique(clusters, return_inverse=True)
+    row_clusters = inverse[coo.row]
+    internal = row_clusters == inverse[coo.col]
+
+    edge_clusters = row_clusters[internal]
+    similarity_sums = np.bincount(
+        edge_clusters, weights=1.0 - coo.data[internal], minlength=len(labels)
+    )
+    edge_counts = np.bincount(edge_clusters, minlength=len(labels))
+
+    # Single-point clusters, or clusters whose members only met through outlier
+    # reassignment, have no internal edges
+    coherence = np.where(
+        edge_counts > 0, similarity_sums / np.maximum(edge_counts, 1), 1.0
+    )
+    return {cluster_id: float(value) for cluster_id, value in zip(labels, coherence)}
@@ -0,0 +1,319 @@
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from config import STATE_DELTA_TOLERANCE, STATE_KEYFRAME_INTERVAL
+
+
+def _point_keys(titles: List[str]) -> List[tuple]:
+    """Identify points by title and occurrence, since chat names can repeat"""
+    seen: Dict[str, int] = {}
+    keys = []
+    for title in titles:
+        seen[title] = seen.get(title, 0) + 1
+        keys.append((title, seen[title]))
+    return keys
+
+
+def diff_states(old: dict, new: dict, tolerance: float = 0.0) -> dict:
+    """Delta that turns state ``old`` into state ``new`` through apply_delta.
+
+    Points are matched by title. Kept points stay in their old order followed
+    by the added ones; ``order`` is only included when ``new`` differs from
+    that. ``moved`` and ``reclustered`` index into the new order, and moves
+    of at most ``tolerance`` in both coordinates are dropped.
+    """
+    old_keys = _point_keys(old["titles"])
+    new_keys = _point_keys(new["titles"])
+    old_index = {key: i for i, key in enumerate(old_keys)}
+    new_key_set = set(new_keys)
+
+    removed = [i for i, key in enumerate(old_keys) if key not in new_key_set]
+    added = [j for j, key in enumerate(new_keys) if key not in old_index]
+
+    removed_set = set(removed)
+    expected = [key for i, key in enumerate(old_keys) if i not in removed_set]
+    expected += [new_keys[j] for j in added]
+    order = None
+    if expected != new_keys:
+        position = {key: k for k, key in enumerate(expected)}
+        order = [position[key] for key in new_keys]
+
+    kept_new = np.array([j for j, key in enumerate(new_keys) if key in old_index], dtype=int)
+    kept_old = np.array([old_index[new_keys[j]] for j in kept_new], dtype=int)
+
+    new_points = np.asarray(new["points"], dtype=float).reshape(-1, 2)
+    old_points = np.asarray(old["points"], dtype=float).reshape(-1, 2)
+    shift = np.abs(new_points[kept_new] - old_points[kept_old]).reshape(-1, 2)
+    moved = kept_new[shift.max(axis=1, initial=0) > tolerance]
+
+    new_clusters = np.asarray(new["clusters"], dtype=np.int64)
+    old_clusters = np.asarray(old["clusters"], dtype=np.int64)
+    reclustered = kept_new[new_clusters[kept_new] != old_clusters[kept_old]]
+
+    old_topics = old.get("topics") or {}
+    new_topics = new.get("topics") or {}
+
+    delta = {
+        "month_year": new["month_year"],
+        "base": old["month_year"],
+        "total_conversations": new["total_conversations"],
+        "removed": removed,
+        "added": {
+            "titles": [new["titles"][j] for j in added],
+            "points": [new["points"][j] for j in added],
+            "clusters": [new["clusters"][j] for j in added],
+        },
+        "moved": {
+            "indices": moved.tolist(),
+            "points": [new["points"][j] for j in moved],
+        },
+        "reclustered": {
+            "indices": reclustered.tolist(),
+            "clusters": [new["clusters"][j] for j in reclustered],
+        },
+        "topics": {k: v for k, v in new_topics.items() if old_topics.get(k) != v},
+        "topics_removed": [k for k in old_topics if k not in new_topics],
+    }
+    if order is not None:
+        delta["order"] = order
+    return delta
+
+
+def apply_delta(old: dict, delta: dict) -> dict:
+    """State produced by applying a diff_states delta to ``old``"""
+    removed = set(delta["removed"])
+    titles = [t for i, t in enumerate(old["titles"]) if i not in removed] + delta["added"]["titles"]
+    points = [p for i, p in enumerate(old["points"]) if i not in removed] + delta["added"]["points"]
+    clusters = [c for i, c in enumerate(old["clusters"]) if i not in removed] + delta["added"]["clusters"]
+
+    if "order" in delta:
+        titles = [titles[k] for k in delta["order"]]
+        points = [points[k] for k in delta["order"]]
+        clusters = [clusters[k] for k in delta["order"]]
+
+    for j, point in zip(delta["moved"]["indices"], delta["moved"]["points"]):
+        points[j] = point
+    for j, cluster in zip(delta["reclustered"]["indices"], delta["reclustered"]["clusters"]):
+        clusters[j] = cluster
+
+    topics_removed = set(delta["topics_removed"])
+    topics = {k: v for k, v in (old.get("topics") or {}).items() if k not in topics_removed}
+    topics.update(delta["topics"])
+
+    return {
+        "month_year": delta["month_year"],
+        "points": points,
+        "clusters": clusters,
+        "titles": titles,
+        "topics": topics,
+        "total_conversations": delta["total_conversations"],
+    }
+
+
+class StateStore:
+    """Monthly map states of one data dir, stored as keyframes plus deltas.
+
+    Every ``keyframe_interval``-th month is written as a full
+    ``state_<month>.json`` snapshot; the months in between are
+    ``delta_<month>.json`` files holding a diff_states delta against the
+    previous month. ``states/manifest.json`` lists every month with its kind
+    and metadata as ``{"version": n, "states": [...]}`` and is replaced
+    atomically on every change, so the timeline can be listed without opening
+    any snapshot.
+    """
+
+    def __init__(
+        self,
+        data_dir: str,
+        keyframe_interval: int = STATE_KEYFRAME_INTERVAL,
+        tolerance: float = STATE_DELTA_TOLERANCE,
+    ):
+        self.states_dir = os.path.join(data_dir, "states")
+        self.path = os.path.join(self.states_dir, "manifest.json")
+        self.keyframe_interval = max(1, keyframe_interval)
+        self.tolerance = tolerance
+        self._lock = threading.Lock()
+        # Last saved state as readers will reconstruct it, to diff the next month against
+        self._current: Optional[dict] = None
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def read_manifest(self) -> dict:
+        if not self.exists():
+            return {"version": 0, "states": []}
+        with open(self.path, "r") as f:
+            return json.load(f)
+
+    def _write_json(self, path: str, data):
+        os.makedirs(self.states_dir, exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def _read_json(self, file_name: str):
+        with open(os.path.join(self.states_dir, file_name), "r") as f:
+            return json.load(f)
+
+    def reset(self):
+        """Start an empty timeline for a new processing run"""
+        with self._lock:
+            version = self.read_manifest()["version"]
+            if os.path.isdir(self.states_dir):
+                for file_name in os.listdir(self.states_dir):
+                    if file_name.startswith(("state_", "delta_")) and file_name.endswith(".json"):
+                        os.remove(os.path.join(self.states_dir, file_name))
+            self._write_json(self.path, {"version": version + 1, "states": []})
+            self._current = None
+
+    def truncate_after(self, month_year: str) -> Optional[dict]:
+        """Drop the months after ``month_year`` and continue the timeline from it.
+
+        Used when a run resumes: states a previous attempt wrote past its last
+        completed month are removed from the manifest and from disk, and the
+        next save diffs against ``month_year``. Returns its state, or None
+        (leaving the timeline untouched) when it was never saved.
+        """
+        state = self.read(month_year)
+        if state is None:
+            return None
+
+        with self._lock:
+            manifest = self.read_manifest()
+            kept = [s for s in manifest["states"] if s["month_year"] <= month_year]
+            dropped = [s for s in manifest["states"] if s["month_year"] > month_year]
+            if dropped:
+                manifest["states"] = kept
+                manifest["version"] += 1
+                self._write_json(self.path, manifest)
+                for entry in dropped:
+                    try:
+                        os.remove(os.path.join(self.states_dir, entry["file"]))
+                    except FileNotFoundError:
+                        pass
+            self._current = state
+        return state
+
+    def save(self, update: dict, seconds: Optional[float] = None):
+        """Store the state of the month just processed and record it in the manifest"""
+        month_year = update["month_year"]
+        # Round-trip through JSON so diffs compare what readers will load
+        state = json.loads(
+            json.dumps(
+                {
+                    "month_year": month_year,
+                    "points": update["points"],
+                    "clusters": update["clusters"],
+                    "titles": update["titles"],
+                    "topics": update["topics"],
+                    "total_conversations": update["total_conversations"],
+                }
+            )
+        )
+
+        with self._lock:
+            manifest = self.read_manifest()
+            states = [s for s in manifest["states"] if s["month_year"] != month_year]
+            since_keyframe = 0
+            for entry in reversed(states):
+                if entry["kind"] == "keyframe":
+                    break
+                since_keyframe += 1
+
+            previous = self._current
+            if (
+                previous is None
+                or not states
+                or states[-1]["month_year"] != previous["month_year"]
+                or previous["month_year"] >= month_year
+                or since_keyframe + 1 >= self.keyframe_interval
+            ):
+                kind, base, file_name = "keyframe", None, f"state_{month_year}.json"
+                self._write_json(os.path.join(self.states_dir, file_name), state)
+                self._current = state
+            else:
+                kind, base, file_name = "delta", previous["month_year"], f"delta_{month_year}.json"
+                delta = diff_states(previous, state, self.tolerance)
+                self._write_json(os.path.join(self.states_dir, file_name), delta)
+                self._current = apply_delta(previous, delta)
+
+            states.append(
+                {
+                    "month_year": month_year,
+                    "kind": kind,
+                    "base": base,
+                    "total_conversations": state["total_conversations"],
+                    "total_clusters": len(set(state["clusters"])),
+                    "file": file_name,
+                    "bytes": os.path.getsize(os.path.join(self.states_dir, file_name)),
+                    "processing_seconds": round(seconds, 3) if seconds is not None else None,
+                    "layout": update.get("layout"),
+                    "written_at": time.time(),
+                }
+            )
+            manifest["states"] = sorted(states, key=lambda s: s["month_year"])
+            manifest["version"] += 1
+            self._write_json(self.path, manifest)
+
+    def read(self, month_year: str) -> Optional[dict]:
+        """Full state of a month, rebuilt from its keyframe and the deltas after it"""
+        if not self.exists():
+            if not os.path.isdir(self.states_dir):
+                return None
+            self.rebuild()
+        states = self.read_manifest()["states"]
+        months = [s["month_year"] for s in states]
+        if month_year not in months:
+            return None
+
+        end = months.index(month_year)
+        start = end
+        while start > 0 and states[start]["kind"] != "keyframe":
+            start -= 1
+
+        state = self._read_json(states[start]["file"])
+        for entry in states[start + 1 : end + 1]:
+            state = apply_delta(state, self._read_json(entry["file"]))
+        return state
+
+    def diff(self, since: str, month_year: str) -> Optional[dict]:
+        """Delta from month ``since`` to ``month_year``, or None if either is missing"""
+        old = self.read(since)
+        new = self.read(month_year)
+        if old is None or new is None:
+            return None
+        return diff_states(old, new, self.tolerance)
+
+    def rebuild(self) -> List[dict]:
+        """Build the manifest from existing snapshot files (data processed before it existed)"""
+        with self._lock:
+            manifest = {"version": self.read_manifest()["version"] + 1, "states": []}
+            if os.path.isdir(self.states_dir):
+                for file_name in sorted(os.listdir(self.states_dir)):
+                    if not (file_name.startswith("state_") and file_name.endswith(".json")):
+                        continue
+                    path = os.path.join(self.states_dir, file_name)
+                    state = self._read_json(file_name)
+                    manifest["states"].append(
+                        {
+                            "month_year": state["month_year"],
+                            "kind": "keyframe",
+                            "base": None,
+                            "total_conversations": state["total_conversations"],
+                            "total_clusters": len(set(state["clusters"])),
+                            "file": file_name,
+                            "bytes": os.path.getsize(path),
+                            "processing_seconds": None,
+                            "layout": None,
+                            "written_at": os.path.getmtime(path),
+                        }
+                    )
+            manifest["states"].sort(key=lambda s: s["month_year"])
+            self._write_json(self.path, manifest)
+            return manifest["states"]
@@ -0,0 +1,111 @@
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import fields
+from typing import List, Optional
+
+from config import TASK_REGISTRY_PATH
+from models import ProcessingTask
+
+TASK_COLUMNS = [f.name for f in fields(ProcessingTask)]
+
+
+class TaskRegistry:
+    """Durable record of processing tasks and the months each one finished.
+
+    A SQLite database with one row per task, mirroring ProcessingTask, and one
+    row per completed month. It is written on every status change and after
+    every saved month, so a restarted server can report old tasks and resume
+    unfinished ones after their last completed month.
+    """
+
+    def __init__(self, path: str = TASK_REGISTRY_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS tasks (
+                    task_id TEXT PRIMARY KEY,
+                    file_path TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    progress REAL NOT NULL,
+                    chat_type TEXT,
+                    data_dir TEXT,
+                    error TEXT,
+                    completed INTEGER NOT NULL,
+                    queued_at REAL,
+                    started_at REAL,
+                    finished_at REAL,
+                    cancel_requested INTEGER NOT NULL
+                )
+                """
+            )
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS task_months (
+                    task_id TEXT NOT NULL,
+                    month_year TEXT NOT NULL,
+                    completed_at REAL NOT NULL,
+                    PRIMARY KEY (task_id, month_year)
+                )
+                """
+            )
+
+    def save(self, task: ProcessingTask):
+        """Insert or update the row of a task"""
+        values = [getattr(task, name) for name in TASK_COLUMNS]
+        placeholders = ", ".join("?" for _ in TASK_COLUMNS)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO tasks ({', '.join(TASK_COLUMNS)}) VALUES ({placeholders})",
+                values,
+            )
+
+    def _task(self, row) -> ProcessingTask:
+        task = ProcessingTask(**dict(zip(TASK_COLUMNS, row)))
+        task.completed = bool(task.completed)
+        task.cancel_requested = bool(task.cancel_requested)
+        return task
+
+    def get(self, task_id: str) -> Optional[ProcessingTask]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(TASK_COLUMNS)} FROM tasks WHERE task_id = ?", (task_id,)
+            ).fetchone()
+        return self._task(row) if row else None
+
+    def load(self) -> List[ProcessingTask]:
+        """Every recorded task, oldest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(TASK_COLUMNS)} FROM tasks ORDER BY queued_at"
+            ).fetchall()
+        return [self._task(row) for row in rows]
+
+    def complete_month(self, task: ProcessingTask, month_year: str):
+        """Record a month whose state and messages are on disk, with the task's progress"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO task_months VALUES (?, ?, ?)",
+                (task.task_id, month_year, time.time()),
+            )
+            self._conn.execute(
+                "UPDATE tasks SET progress = ? WHERE task_id = ?", (task.progress, task.task_id)
+            )
+
+    def last_completed_month(self, task_id: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MAX(month_year) FROM task_months WHERE task_id = ?", (task_id,)
+            ).fetchone()
+        return row[0]
+
+    def clear_months(self, task_id: str):
+        """Forget completed months, for a run that starts over"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM task_months WHERE task_id = ?", (task_id,))
@@ -1,12 +1,24 @@
-import requests
 import os
 
+from config import TOPIC_TIMEOUT
+from services.llm_cache import get_llm_cache
+from services.ollama_client import OllamaError, OllamaTimeout, get_client
+
 GENERATION_MODEL = os.getenv("GENERATION_MODEL", "qwen2.5-coder:7b")
 
+# Bump whenever the prompt below changes so cached labels are not reused
+TOPIC_PROMPT_VERSION = 1
+
 
-def generate_topic_for_cluster(titles):
+def generate_topic_for_cluster(titles, timeout=TOPIC_TIMEOUT):
     """Generate a topic label for a cluster of titles"""
-    titles_text = "\n".join(f"- {title}" for title in titles)
+    cache = get_llm_cache()
+    cache_key = cache.make_key("topic", GENERATION_MODEL, TOPIC_PROMPT_VERSION, titles)
+    cached_topic = cache.get(cache_key)
+    if cached_topic is not None:
+        return cached_topic
+
+    titles_text = "\n".join(f"- {title}" for title in sorted(titles))
     prompt = f"""You are a technical topic analyzer. Review these related titles and provide a single concise topic label (2-4 words) that best describes their common theme.
 
 Titles:
@@ -19,26 +31,25 @@ Provide ONLY the topic label, nothing else. Examples:
 "API Integration"
 """
 
-    payload = {
-        "model": GENERATION_MODEL,
-        "prompt": prompt,
-        "stream": False,
-        "options": {"temperature": 0.2},
-    }
-
     try:
-        response = requests.post(
-            "http://localhost:11434/api/generate",
-            json=payload,
-            headers={"Content-Type": "application/json"},
+        # A single attempt, so ``timeout`` bounds the whole topic and not each retry
+        topic = get_client().generate(
+            prompt,
+            GENERATION_MODEL,
+            options={"temperature": 0.2},
+            timeout=timeout,
+            max_retries=0,
         )
-
-        if response.status_code == 200:
-            topic = response.json().get("response", "").strip()
-            return topic if topic else "Miscellaneous"
-        else:
-            print(f"Error: Received status code {response.status_code}")
-            return "Error generating topic"
+        if not topic:
+            return "Miscellaneous"
+        cache.put(cache_key, "topic", topic)
+        return topic
+    except OllamaTimeout as e:
+        print(f"Topic generation timed out: {str(e)}")
+        return "Miscellaneous"
+    except OllamaError as e:
+        print(f"Error: {str(e)}")
+        return "Error generating topic"
     except Exception as e:
         print(f"Error generating topic: {str(e)}")
         return "Error"
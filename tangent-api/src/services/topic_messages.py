@@ -0,0 +1,152 @@
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from services.embedding import get_embeddings
+from services.ingest import conversation_labels
+
+TOPIC_MESSAGES_FILE = "topic_messages.npz"
+
+
+class TopicMessageIndex:
+    """Per-message embeddings of one data dir, with message rows grouped by cluster.
+
+    Rows line up with the message store read order, which is recorded as
+    ``store_version`` so a stale index can be detected.
+    """
+
+    def __init__(self, vectors, lengths, clusters, store_version: int, stamp=None):
+        self.vectors = np.asarray(vectors, dtype=np.float32)
+        self.norms = np.maximum(np.linalg.norm(self.vectors, axis=1), 1e-12)
+        self.lengths = np.asarray(lengths, dtype=np.float64)
+        self.clusters = np.asarray(clusters, dtype=np.int64)
+        self.store_version = int(store_version)
+        self.stamp = stamp
+
+        self.rows_by_cluster = np.argsort(self.clusters, kind="stable")
+        labels, starts = np.unique(self.clusters[self.rows_by_cluster], return_index=True)
+        ends = np.append(starts[1:], len(self.clusters))
+        self.cluster_ranges = {
+            int(label): (int(start), int(end)) for label, start, end in zip(labels, starts, ends)
+        }
+
+    def __len__(self):
+        return len(self.clusters)
+
+    def rows(self, cluster_id: int) -> np.ndarray:
+        """Message rows in a cluster"""
+        start, end = self.cluster_ranges.get(int(cluster_id), (0, 0))
+        return self.rows_by_cluster[start:end]
+
+    def rank(self, cluster_id: int, limit: int = 20) -> List[int]:
+        """Rows of the most representative messages in a cluster, best first.
+
+        Scores are 0.6 x cosine similarity to the cluster centroid plus
+        0.4 x text length relative to the longest message in the cluster.
+        """
+        rows = self.rows(cluster_id)
+        if len(rows) == 0:
+            return []
+
+        vectors = self.vectors[rows]
+        centroid = vectors.mean(axis=0)
+        similarities = (vectors @ centroid) / (
+            self.norms[rows] * max(np.linalg.norm(centroid), 1e-12)
+        )
+        lengths = self.lengths[rows]
+        length_scores = lengths / max(lengths.max(), 1)
+        scores = 0.6 * similarities + 0.4 * length_scores
+
+        if len(scores) > limit:
+            top = np.argpartition(-scores, limit - 1)[:limit]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return rows[top].tolist()
+
+    def save(self, path: str):
+        tmp_path = path + ".tmp.npz"
+        np.savez(
+            tmp_path,
+            vectors=self.vectors,
+            lengths=self.lengths,
+            clusters=self.clusters,
+            store_version=np.int64(self.store_version),
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, stamp=None) -> "TopicMessageIndex":
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                data["vectors"],
+                data["lengths"],
+                data["clusters"],
+                int(data["store_version"]),
+                stamp,
+            )
+
+
+def message_clusters(messages: pd.DataFrame, titles: Sequence[str], clusters: Sequence[int]) -> np.ndarray:
+    """Cluster of every message's chat branch title, -1 where the title is not clustered"""
+    title_clusters = dict(zip(titles, clusters))
+    labels = conversation_labels(messages["chat_id"], messages["chat_name"])
+    branch_titles = labels + " (Branch " + messages["branch_id"].astype(str) + ")"
+    mapped = branch_titles.map(title_clusters)
+    # Titles written before branches were split out are bare chat names
+    mapped = mapped.fillna(messages["chat_name"].map(title_clusters))
+    return mapped.fillna(-1).astype(np.int64).to_numpy()
+
+
+def build_topic_message_index(
+    messages: pd.DataFrame,
+    titles: Sequence[str],
+    clusters: Sequence[int],
+    store_version: int,
+    data_dir: str,
+) -> Optional[TopicMessageIndex]:
+    """Embed every message once and store the index used by /content/identify-messages"""
+    start = time.time()
+    texts = messages["text"].fillna("").astype(str).tolist()
+    embeddings = get_embeddings(texts)
+    if embeddings is None or len(embeddings) != len(texts):
+        print("Could not embed messages; topic message index not written")
+        return None
+
+    index = TopicMessageIndex(
+        np.asarray(embeddings, dtype=np.float32).reshape(len(texts), -1),
+        [len(text) for text in texts],
+        message_clusters(messages, titles, clusters),
+        store_version,
+    )
+    index.save(os.path.join(data_dir, TOPIC_MESSAGES_FILE))
+    print(f"Indexed {len(index)} message embeddings in {time.time() - start:.2f}s")
+    return index
+
+
+_indexes: Dict[str, TopicMessageIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_topic_message_index(data_dir: str) -> Optional[TopicMessageIndex]:
+    """Topic message index for a data dir, reloaded when its file changes"""
+    path = os.path.join(data_dir, TOPIC_MESSAGES_FILE)
+    try:
+        stamp = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+    index = _indexes.get(data_dir)
+    if index is not None and index.stamp == stamp:
+        return index
+
+    with _indexes_lock:
+        index = _indexes.get(data_dir)
+        if index is None or index.stamp != stamp:
+            index = TopicMessageIndex.load(path, stamp)
+            _indexes[data_dir] = index
+        return index
@@ -0,0 +1,187 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from config import PAYLOAD_CACHE_MAX_BYTES, PAYLOAD_CACHE_MAX_ENTRIES
+from services.binary_payload import BINARY_MIMETYPE, encode_points_payload
+from services.state_store import StateStore
+from utils import load_visualization_data
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+JSON_MIMETYPE = "application/json"
+
+VISUALIZATION_FILES = [
+    "embeddings_2d.json",
+    "clusters.json",
+    "topics.json",
+    "chat_titles.json",
+    "chats_with_reflections.json",
+]
+
+
+class EncodedPayload:
+    """A JSON response body serialised and compressed once, with its ETag"""
+
+    def __init__(self, body: bytes, stamp=None, mimetype: str = JSON_MIMETYPE):
+        self.body = body
+        self.stamp = stamp
+        self.mimetype = mimetype
+        self.etag = hashlib.sha1(body).hexdigest()
+        self.encoded = {"gzip": gzip.compress(body, compresslevel=6)}
+        if brotli is not None:
+            self.encoded["br"] = brotli.compress(body, quality=5)
+
+    @property
+    def size(self) -> int:
+        """Bytes held by the body and its compressed encodings"""
+        return len(self.body) + sum(len(encoded) for encoded in self.encoded.values())
+
+    @classmethod
+    def from_json(cls, data, stamp=None) -> "EncodedPayload":
+        return cls(json.dumps(data, separators=(",", ":"), sort_keys=True).encode("utf-8"), stamp)
+
+    def encoding_for(self, accept_encodings) -> Optional[str]:
+        """Best pre-compressed encoding the client accepts, None for identity"""
+        for encoding in ("br", "gzip"):
+            if encoding in self.encoded and accept_encodings[encoding]:
+                return encoding
+        return None
+
+
+def files_stamp(data_dir: str, file_names) -> tuple:
+    """Data version of a set of files: their mtimes and sizes"""
+    stamp = []
+    for file_name in file_names:
+        try:
+            st = os.stat(os.path.join(data_dir, file_name))
+        except FileNotFoundError:
+            continue
+        stamp.append((file_name, st.st_mtime_ns, st.st_size))
+    return tuple(stamp)
+
+
+class PayloadCache:
+    """Encoded payloads by key, least recently used evicted first.
+
+    Bounded by entry count and total encoded size; the payload just stored is
+    always kept, even when it alone exceeds ``max_bytes``.
+    """
+
+    def __init__(self, max_entries: int = PAYLOAD_CACHE_MAX_ENTRIES, max_bytes: int = PAYLOAD_CACHE_MAX_BYTES):
+        self.max_entries = max(1, max_entries)
+        self.max_bytes = max_bytes
+        self._payloads: "OrderedDict[tuple, EncodedPayload]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._payloads)
+
+    def _get(self, key: tuple, stamp: tuple) -> Optional[EncodedPayload]:
+        with self._lock:
+            payload = self._payloads.get(key)
+            if payload is None or payload.stamp != stamp:
+                return None
+            self._payloads.move_to_end(key)
+            return payload
+
+    def _put(self, key: tuple, payload: EncodedPayload):
+        with self._lock:
+            previous = self._payloads.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous.size
+            self._payloads[key] = payload
+            self._bytes += payload.size
+            while len(self._payloads) > 1 and (
+                len(self._payloads) > self.max_entries or self._bytes > self.max_bytes
+            ):
+                _, evicted = self._payloads.popitem(last=False)
+                self._bytes -= evicted.size
+
+    def get(self, key: tuple, stamp: tuple, build: Callable[[], EncodedPayload]) -> EncodedPayload:
+        """Payload cached under ``key``, rebuilt with ``build`` whenever ``stamp`` changes"""
+        payload = self._get(key, stamp)
+        if payload is not None:
+            return payload
+
+        with self._build_lock:
+            payload = self._get(key, stamp)
+            if payload is None:
+                payload = build()
+                payload.stamp = stamp
+                self._put(key, payload)
+            return payload
+
+
+_payloads = PayloadCache()
+
+
+def cached_payload(key: tuple, stamp: tuple, build: Callable[[], EncodedPayload]) -> EncodedPayload:
+    """Payload cached under ``key``, rebuilt with ``build`` whenever ``stamp`` changes"""
+    return _payloads.get(key, stamp, build)
+
+
+def encode_payload(data, mimetype: str) -> EncodedPayload:
+    """Encode a JSON-shaped payload as JSON or as the binary points format"""
+    if mimetype == BINARY_MIMETYPE:
+        return EncodedPayload(encode_points_payload(data or {}), mimetype=BINARY_MIMETYPE)
+    return EncodedPayload.from_json(data)
+
+
+def get_visualization_payload(data_dir: str, mimetype: str = JSON_MIMETYPE) -> EncodedPayload:
+    """The /visualization response for a data dir, rebuilt only when its files change"""
+
+    def build():
+        data = load_visualization_data(data_dir)
+        if not data["points"] or not data["clusters"] or not data["titles"]:
+            return encode_payload([], mimetype)
+        payload = encode_payload(
+            {
+                "points": data["points"],
+                "clusters": data["clusters"],
+                "titles": data["titles"],
+                "topics": data["topics"],
+                "chats_with_reflections": data["chats_with_reflections"],
+            },
+            mimetype,
+        )
+        print(
+            f"Cached {mimetype} visualization payload for {data_dir}: "
+            f"{len(payload.body)} bytes, {len(payload.encoded['gzip'])} gzipped"
+        )
+        return payload
+
+    stamp = files_stamp(data_dir, VISUALIZATION_FILES)
+    return cached_payload(("visualization", data_dir, mimetype), stamp, build)
+
+
+def get_state_payload(
+    data_dir: str, month_year: str, mimetype: str = JSON_MIMETYPE, since: Optional[str] = None
+) -> Optional[EncodedPayload]:
+    """The state of one month, or its delta since another month; None when missing"""
+    state_store = StateStore(data_dir)
+    if not state_store.exists() and not os.path.isdir(state_store.states_dir):
+        return None
+    if not state_store.exists():
+        state_store.rebuild()
+
+    months = {entry["month_year"] for entry in state_store.read_manifest()["states"]}
+    if month_year not in months or (since is not None and since not in months):
+        return None
+
+    def build():
+        if since is not None:
+            return encode_payload(state_store.diff(since, month_year), JSON_MIMETYPE)
+        return encode_payload(state_store.read(month_year), mimetype)
+
+    stamp = files_stamp(data_dir, [os.path.join("states", "manifest.json")])
+    return cached_payload(("state", data_dir, month_year, since, mimetype), stamp, build)
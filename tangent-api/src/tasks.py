@@ -1,17 +1,15 @@
-import time
 from typing import Optional
-from services.background_processor import BackgroundProcessor
+from services.background_processor import get_background_processor
 
 
 class TaskManager:
     def __init__(self):
-        self.background_processor = BackgroundProcessor()
+        # Same scheduler as the API, so task ids are valid in both
+        self.background_processor = get_background_processor()
 
     def start_task(self, file_path: str) -> str:
-        task_id = str(time.time())
         try:
-            self.background_processor.start_task(file_path)
-            return task_id
+            return self.background_processor.start_task(file_path)
         except Exception as e:
             print(f"Error starting task: {str(e)}")
             return ""
@@ -19,5 +17,5 @@ class TaskManager:
     def get_task_status(self, task_id: str) -> Optional[dict]:
         return self.background_processor.get_task_status(task_id)
 
-    def process_queue(self):
-        self.background_processor._process_queue()
+    def cancel_task(self, task_id: str) -> bool:
+        return self.background_processor.cancel_task(task_id)
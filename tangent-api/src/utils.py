@@ -19,8 +19,8 @@ def check_files_exist(data_dir: str) -> dict:
     return existing_files
 
 
-def send_progress(step, progress=0):
-    return f"data: {json.dumps({'type': 'progress', 'step': step, 'progress': progress})}\n\n"
+def send_progress(step, progress=0, **details):
+    return f"data: {json.dumps({'type': 'progress', 'step': step, 'progress': progress, **details})}\n\n"
 
 
 def send_error(message):